@@ -1,13 +1,29 @@
 from .chess import GameController, Game, Piece, Rook, Knight, King, Queen, Pawn, Bishop
-from .mcts import MCTS, Node
+from .mcts import MCTS, Node, TranspositionTable, RootParallelMCTS, SearchResult, SearchStats
 from .chess_adapter import GameControllerAdapter
+from .position import Position
+from .bitboard import BitboardPosition
+from .rollout import Rollout
+from .evaluate import Evaluator
+from .treefile import TreeFile
+from .book import OpeningBook
 
 __all__ = [
     'GameController',
     'Game',
     'Node',
     'MCTS',
+    'TranspositionTable',
+    'RootParallelMCTS',
+    'SearchResult',
+    'SearchStats',
     'GameControllerAdapter',
+    'Position',
+    'BitboardPosition',
+    'Rollout',
+    'Evaluator',
+    'TreeFile',
+    'OpeningBook',
     'Rook',
     'King',
     'Queen',
@@ -0,0 +1,292 @@
+""" Benchmarks of the chess engine and MCTS.
+    Run with: python -m chess.bench [--output results.json] [--compare baseline.json --threshold 0.2]
+
+    Measured are perft (nodes and nodes/sec) for the move generation backends from the start position and a set of fixed positions,
+    random actions (plies/sec), full rollouts (rollouts/sec), MCTS (iterations/sec and peak memory) and the generation of legal moves
+    (with attack maps and naively by trying every reply, in positions/sec).
+    Every benchmark runs in a fresh process, so that the peak memory of one benchmark is not inherited by the next. The suite is repeated
+    and every metric is the median over the repetitions.
+    The results are written as JSON. In comparison mode, the run fails if a throughput (any metric ending in "_per_second")
+    dropped by more than the threshold relative to the baseline results. Single runs vary by more than 10%, hence the default of 20%.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .chess import GameController
+from .chess_adapter import GameControllerAdapter
+from .mcts import MCTS, playout
+from .position import Position, square
+from .bitboard import BitboardPosition
+from .rollout import Rollout, random_policy, capture_first_policy
+
+# Fixed positions as moves ((xs, ys), (xt, yt)) played from the start position.
+FIXED_POSITIONS = {
+    "start": [],
+    "italian": [((4, 1), (4, 3)), ((4, 6), (4, 4)), ((6, 0), (5, 2)), ((1, 7), (2, 5)), ((5, 0), (2, 3)), ((5, 7), (2, 4))],
+    "scandinavian": [((4, 1), (4, 3)), ((3, 6), (3, 4)), ((4, 3), (3, 4)), ((3, 7), (3, 4)), ((1, 0), (2, 2)), ((3, 4), (0, 4))],
+    "open_lines": [((3, 1), (3, 3)), ((4, 6), (4, 4)), ((3, 3), (4, 4)), ((5, 6), (5, 4)), ((2, 0), (6, 4)), ((6, 7), (5, 5)),
+                   ((4, 4), (5, 5)), ((6, 6), (5, 5)), ((6, 4), (5, 5)), ((3, 7), (5, 5))],
+}
+
+def perft(position, depth):
+    """ Number of nodes at the given depth of the game tree from a Position or BitboardPosition. Finished games are leaves. """
+    if depth == 0 or position.winner is not None:
+        return 1
+    if depth == 1:
+        return len(position.moves())
+    nodes = 0
+    for start, target in position.moves():
+        position.make_move(start, target)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+def perft_controller(ctl, depth):
+    """ Same as perft for the GameController object model, which has to copy the controller for every move. """
+    if depth == 0 or ctl.game.winner is not None:
+        return 1
+    nodes = 0
+    for piece, targets in ctl.get_possible_moves():
+        if depth == 1:
+            nodes += len(targets)
+            continue
+        for target in targets:
+            child = ctl.get_deep_copy()
+            child.move(piece.coordinates(), target.coordinates(), verbose=False)
+            nodes += perft_controller(child, depth - 1)
+    return nodes
+
+def fixed_position(name, backend):
+    """ The fixed position of the given name for a backend ("objects", "array" or "bitboard"). """
+    moves = FIXED_POSITIONS[name]
+    if backend == "objects":
+        ctl = GameController()
+        for start, target in moves:
+            ctl.move(start, target, verbose=False)
+        return ctl
+    position = Position() if backend == "array" else BitboardPosition()
+    for (xs, ys), (xt, yt) in moves:
+        position.make_move(square(xs, ys), square(xt, yt))
+    return position
+
+# Perft functions by backend.
+PERFT_BACKENDS = {
+    "objects": perft_controller,
+    "array": perft,
+    "bitboard": perft,
+}
+
+# Short measurements are repeated until they take at least this many seconds, to reduce noise.
+MIN_SECONDS = 0.2
+
+def timed(function, *args):
+    """ Returns the result of function(*args) and its average run time in seconds (over as many runs as fit into MIN_SECONDS). """
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        result = function(*args)
+        runs += 1
+        seconds = time.perf_counter() - start
+        if seconds >= MIN_SECONDS:
+            return result, seconds / runs
+
+def per_second(count, seconds):
+    return count / seconds if seconds > 0 else float("inf")
+
+def peak_memory_mb():
+    """ Peak resident memory of the process in MB (see isolated). """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def benchmark_perft(depth, backends=tuple(PERFT_BACKENDS), positions=tuple(FIXED_POSITIONS), objects_depth=None):
+    """ Runs perft for every backend, position and depth from 1 to depth. Returns a dict of metrics.
+        objects_depth: The maximum depth for the (slow) object model backend.
+    """
+    metrics = {}
+    for name in positions:
+        for backend in backends:
+            max_depth = depth if backend != "objects" or objects_depth is None else min(depth, objects_depth)
+            position = fixed_position(name, backend)
+            for d in range(1, max_depth + 1):
+                nodes, seconds = timed(PERFT_BACKENDS[backend], position, d)
+                prefix = f"perft.{name}.{backend}.depth{d}."
+                metrics[prefix + "nodes"] = nodes
+                metrics[prefix + "nodes_per_second"] = per_second(nodes, seconds)
+    return metrics
+
+def benchmark_random_actions(n_plies):
+    """ Plies per second of GameControllerAdapter.perform_random_action (restarting finished games). """
+    state = GameControllerAdapter(GameController())
+    start = time.perf_counter()
+    for i in range(n_plies):
+        if state.is_final():
+            state = GameControllerAdapter(GameController())
+        state = state.perform_random_action()
+    return {"random_actions.plies_per_second": per_second(n_plies, time.perf_counter() - start)}
+
+def benchmark_rollouts(n_rollouts):
+    """ Full rollouts per second from the start position: the random playout of MCTS and the rollout engine. """
+    metrics = {}
+    state = GameControllerAdapter(GameController())
+    rollouts = {
+        "playout": playout,
+        "random": Rollout(random_policy),
+        "capture_first": Rollout(capture_first_policy),
+    }
+    for name, rollout in rollouts.items():
+        start = time.perf_counter()
+        for i in range(n_rollouts):
+            rollout(state, 0)
+        seconds = time.perf_counter() - start
+        metrics[f"rollouts.{name}.rollouts_per_second"] = per_second(n_rollouts, seconds)
+    return metrics
+
+def benchmark_mcts(n_simulations, n_children=20):
+    """ MCTS iterations per second from the start position and the peak memory afterwards. """
+    mcts = MCTS(GameControllerAdapter(GameController()))
+    result = mcts.run(n_simulations, verbose=False, n_children=n_children)
+    return {
+        "mcts.iterations_per_second": per_second(result.simulations, result.elapsed),
+        "mcts.nodes": result.nodes,
+        "mcts.peak_memory_mb": peak_memory_mb(),
+    }
+
+def legal_moves_naive(ctl):
+    """ Legal moves of the active player found naively: every possible move is tried on a copy of the controller and dropped if a reply beats the own king.
+        Same result as get_possible_moves of a controller with legal=True (as a dict start -> sorted targets).
+    """
+    player = ctl.game.players.index(ctl.game.activePlayer)
+    legal_moves = {}
+    for piece, targets in ctl.get_possible_moves():
+        legal_targets = []
+        for target in targets:
+            child = ctl.get_deep_copy()
+            child.move(piece.coordinates(), target.coordinates(), verbose=False)
+            king = child.game.players[player].king
+            if child.game.winner is None and any(field.piece is king for reply, fields in child.get_possible_moves() for field in fields):
+                continue
+            legal_targets.append(target.coordinates())
+        legal_moves[piece.coordinates()] = sorted(legal_targets)
+    return legal_moves
+
+def legal_moves(ctl):
+    return {piece.coordinates(): sorted(field.coordinates() for field in fields) for piece, fields in ctl.get_possible_moves()}
+
+def benchmark_legal(positions=tuple(FIXED_POSITIONS), n_plies=200):
+    """ Positions per second of the move generation of the object model: pseudo-legal moves, legal moves with attack maps and legal moves found naively.
+        Also plies per second of random games with and without legal moves (including the incremental update of the attack maps).
+    """
+    metrics = {}
+    for name in positions:
+        ctl = fixed_position(name, "objects")
+        legal_ctl = GameController.from_position(ctl.get_position(), legal=True)
+        naive, seconds_naive = timed(legal_moves_naive, ctl)
+        if naive != legal_moves(legal_ctl):
+            raise AssertionError(f"Legal moves with attack maps differ from the naive legal moves in position {name}.")
+        pseudo, seconds_pseudo = timed(ctl.get_possible_moves)
+        legal, seconds_legal = timed(legal_ctl.get_possible_moves)
+        metrics[f"legal.{name}.pseudo_legal_per_second"] = per_second(1, seconds_pseudo)
+        metrics[f"legal.{name}.attack_maps_per_second"] = per_second(1, seconds_legal)
+        metrics[f"legal.{name}.naive_per_second"] = per_second(1, seconds_naive)
+    for legal in (False, True):
+        ctl = GameController(legal=legal)
+        start = time.perf_counter()
+        for i in range(n_plies):
+            moves = [(piece, field) for piece, fields in ctl.get_possible_moves() for field in fields]
+            if ctl.game.winner is not None or not moves:
+                ctl = GameController(legal=legal)
+                continue
+            piece, field = random.choice(moves)
+            ctl.move_piece(piece, field, check_possible_move=False, verbose=False)
+        metrics[f"legal.random_game.{'legal' if legal else 'pseudo_legal'}.plies_per_second"] = per_second(n_plies, time.perf_counter() - start)
+    return metrics
+
+def seeded(seed, function, *args):
+    random.seed(seed)
+    return function(*args)
+
+def isolated(seed, function, *args):
+    """ Runs function(*args) with the random seed in a fresh (spawned, not forked) process and returns its metrics.
+        The peak memory measured there is that of the benchmark alone.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(seeded, seed, function, *args).result()
+
+def medians(runs):
+    """ The median of every metric over a list of runs (dicts of metrics). """
+    return {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+
+def compare(metrics, baseline, threshold):
+    """ Returns the regressions as a list of (metric, baseline value, value): throughputs more than threshold (a fraction) below the baseline. """
+    regressions = []
+    for name, value in metrics.items():
+        if name.endswith("_per_second") and name in baseline and value < baseline[name] * (1 - threshold):
+            regressions.append((name, baseline[name], value))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the chess engine and MCTS.")
+    parser.add_argument("--depth", type=int, default=4, help="Maximum perft depth.")
+    parser.add_argument("--objects-depth", type=int, default=2, help="Maximum perft depth of the (slow) object model backend.")
+    parser.add_argument("--backends", nargs="+", default=list(PERFT_BACKENDS), choices=list(PERFT_BACKENDS))
+    parser.add_argument("--positions", nargs="+", default=list(FIXED_POSITIONS), choices=list(FIXED_POSITIONS))
+    parser.add_argument("--plies", type=int, default=2000, help="Number of random actions.")
+    parser.add_argument("--rollouts", type=int, default=50, help="Number of rollouts per rollout type.")
+    parser.add_argument("--simulations", type=int, default=300, help="Number of MCTS iterations.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative drop of a throughput in comparison mode.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of the suite. The metrics are the medians.")
+    args = parser.parse_args(argv)
+
+    benchmarks = [
+        (benchmark_perft, args.depth, args.backends, args.positions, args.objects_depth),
+        (benchmark_random_actions, args.plies),
+        (benchmark_rollouts, args.rollouts),
+        (benchmark_mcts, args.simulations),
+        (benchmark_legal, args.positions),
+    ]
+    runs = []
+    for i in range(args.repeat):
+        run = {}
+        for function, *function_args in benchmarks:
+            run.update(isolated(args.seed, function, *function_args))
+        runs.append(run)
+    metrics = medians(runs)
+    results = {
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": metrics,
+    }
+
+    for name, value in metrics.items():
+        print(f"{name:55} {value:14.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(metrics, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"Regression: {name} dropped from {before:.1f} to {after:.1f} ({after / before - 1:+.1%}).")
+        if regressions:
+            return 1
+        print(f"No throughput dropped by more than {args.threshold:.0%}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# A bitboard representation of a game situation.
+# Every piece code (see position.py) has a 64-bit integer with one bit per square (bit = y*8 + x) occupied by such a piece.
+# Attacks of knights, kings and pawns are precomputed per square. Sliding attacks follow precomputed rays up to the first occupied square.
+# The move rules are the same as in the object model of chess.py (Piece.can_move_to) and in Position.
+# BitboardPosition has the same interface as Position and can be used wherever a Position is expected.
+from .tables import KNIGHT_OFFSETS, KING_OFFSETS
+from .zobrist import hash_board, move_keys
+from .position import Position, initial_board, square, coordinates, WHITE, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK_OFFSET, COLOR, KIND
+
+FULL = (1 << 64) - 1
+
+def bit(x, y):
+    return 1 << square(x, y)
+
+def steps_mask(sq, offsets):
+    x, y = coordinates(sq)
+    mask = 0
+    for dx, dy in offsets:
+        if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+            mask |= bit(x + dx, y + dy)
+    return mask
+
+def ray_mask(sq, dx, dy):
+    x, y = coordinates(sq)
+    mask = 0
+    x, y = x + dx, y + dy
+    while 0 <= x < 8 and 0 <= y < 8:
+        mask |= bit(x, y)
+        x, y = x + dx, y + dy
+    return mask
+
+KNIGHT_ATTACKS = tuple(steps_mask(sq, KNIGHT_OFFSETS) for sq in range(64))
+KING_ATTACKS = tuple(steps_mask(sq, KING_OFFSETS) for sq in range(64))
+# Diagonal pawn attacks, indexed by [color][square].
+PAWN_ATTACKS = (
+    tuple(steps_mask(sq, ((-1, 1), (1, 1))) for sq in range(64)),
+    tuple(steps_mask(sq, ((-1, -1), (1, -1))) for sq in range(64)),
+)
+
+# Ray masks indexed by [direction][square]. The first four directions point towards higher squares, so the first
+# blocker on such a ray is its lowest set bit. The last four point towards lower squares (the first blocker is the highest set bit).
+# (The ray tables of tables.py hold the squares of a ray instead.)
+MASK_DIRECTIONS = ((1, 0), (0, 1), (1, 1), (-1, 1), (-1, 0), (0, -1), (1, -1), (-1, -1))
+RAY_MASKS = tuple(tuple(ray_mask(sq, dx, dy) for sq in range(64)) for dx, dy in MASK_DIRECTIONS)
+ROOK_RAY_MASKS = ((RAY_MASKS[0], RAY_MASKS[1]), (RAY_MASKS[4], RAY_MASKS[5]))
+BISHOP_RAY_MASKS = ((RAY_MASKS[2], RAY_MASKS[3]), (RAY_MASKS[6], RAY_MASKS[7]))
+
+def sliding_attacks(sq, occupied, rays):
+    """ Squares attacked from sq along the given (positive, negative) rays. Each ray ends at (and includes) its first occupied square. """
+    positive, negative = rays
+    attacks = 0
+    for ray_masks in positive:
+        ray = ray_masks[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= ray_masks[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for ray_masks in negative:
+        ray = ray_masks[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= ray_masks[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occupied):
+    return sliding_attacks(sq, occupied, ROOK_RAY_MASKS)
+
+def bishop_attacks(sq, occupied):
+    return sliding_attacks(sq, occupied, BISHOP_RAY_MASKS)
+
+def squares(bb):
+    """ The squares of the set bits as a list, lowest first. """
+    result = []
+    while bb:
+        low = bb & -bb
+        result.append(low.bit_length() - 1)
+        bb ^= low
+    return result
+
+class BitboardPosition:
+    """ A game situation held as twelve bitboards (one per piece code) and the occupancy of both players.
+        A mailbox board of piece codes (as in Position) is kept alongside to look up the piece on a square.
+    """
+    __slots__ = ("pieces", "occupied", "board", "active", "winner", "hash", "history")
+
+    def __init__(self, board=None, active=WHITE, winner=None):
+        self.board = initial_board() if board is None else bytearray(board)
+        # Bitboards indexed by piece code (index 0 is unused) and occupancy indexed by color.
+        self.pieces = [0] * 13
+        self.occupied = [0, 0]
+        for sq, code in enumerate(self.board):
+            if code != EMPTY:
+                self.pieces[code] |= 1 << sq
+                self.occupied[COLOR[code]] |= 1 << sq
+        self.active = active
+        self.winner = winner
+        self.hash = hash_board(self.board, active)
+        # Undo stack of (start, target, beaten piece code, previous winner).
+        self.history = []
+
+    def copy(self):
+        """ Copy of the position without the undo stack. """
+        position = BitboardPosition.__new__(BitboardPosition)
+        position.board = bytearray(self.board)
+        position.pieces = self.pieces[:]
+        position.occupied = self.occupied[:]
+        position.active = self.active
+        position.winner = self.winner
+        position.hash = self.hash
+        position.history = []
+        return position
+
+    def is_final(self):
+        return self.winner is not None
+
+    def moves(self):
+        """ Returns all possible moves of the active player as a list of (start, target) squares. """
+        active = self.active
+        offset = BLACK_OFFSET * active
+        pieces = self.pieces
+        own = self.occupied[active]
+        enemy = self.occupied[active ^ 1]
+        occupied = own | enemy
+        free = ~own & FULL
+        moves = []
+
+        # Targets of every piece, generated from the precomputed attack tables and the sliding attacks.
+        targets = []
+        for kind, attacks in ((KNIGHT, KNIGHT_ATTACKS), (KING, KING_ATTACKS)):
+            for start in squares(pieces[kind + offset]):
+                targets.append((start, attacks[start] & free))
+        for start in squares(pieces[ROOK + offset] | pieces[QUEEN + offset]):
+            targets.append((start, sliding_attacks(start, occupied, ROOK_RAY_MASKS) & free))
+        for start in squares(pieces[BISHOP + offset] | pieces[QUEEN + offset]):
+            targets.append((start, sliding_attacks(start, occupied, BISHOP_RAY_MASKS) & free))
+
+        # Pawns beat diagonally, move one square forward onto a free square and initially move two squares
+        # (where, as in Pawn.can_move_to, the target may hold an enemy piece).
+        pawn_attacks = PAWN_ATTACKS[active]
+        direction = 8 if active == WHITE else -8
+        initial_row = 1 if active == WHITE else 6
+        for start in squares(pieces[PAWN + offset]):
+            pawn_targets = pawn_attacks[start] & enemy
+            forward = start + direction
+            if 0 <= forward < 64 and not occupied >> forward & 1:
+                pawn_targets |= 1 << forward
+                if start >> 3 == initial_row:
+                    pawn_targets |= 1 << (forward + direction) & free
+            targets.append((start, pawn_targets))
+
+        for start, bb in targets:
+            for target in squares(bb):
+                moves.append((start, target))
+        return moves
+
+    def make_move(self, start, target):
+        """ Moves the piece on start to target without checking the move. Beating the enemy king wins the game. """
+        board = self.board
+        code = board[start]
+        beaten = board[target]
+        self.history.append((start, target, beaten, self.winner))
+        self.hash ^= move_keys(code, start, target, beaten)
+        start_bit = 1 << start
+        target_bit = 1 << target
+        self.pieces[code] ^= start_bit | target_bit
+        self.occupied[self.active] ^= start_bit | target_bit
+        if beaten != EMPTY:
+            self.pieces[beaten] ^= target_bit
+            self.occupied[self.active ^ 1] ^= target_bit
+            if KIND[beaten] == KING:
+                self.winner = self.active
+        board[target] = code
+        board[start] = EMPTY
+        self.active ^= 1
+
+    def unmake_move(self):
+        """ Reverts the last move done with make_move. """
+        start, target, beaten, winner = self.history.pop()
+        self.active ^= 1
+        board = self.board
+        code = board[target]
+        self.hash ^= move_keys(code, start, target, beaten)
+        start_bit = 1 << start
+        target_bit = 1 << target
+        self.pieces[code] ^= start_bit | target_bit
+        self.occupied[self.active] ^= start_bit | target_bit
+        if beaten != EMPTY:
+            self.pieces[beaten] ^= target_bit
+            self.occupied[self.active ^ 1] ^= target_bit
+        board[start] = code
+        board[target] = beaten
+        self.winner = winner
+
+    def __eq__(self, other):
+        if not isinstance(other, (BitboardPosition, Position)):
+            return NotImplemented
+        return self.board == other.board and self.active == other.active and self.winner == other.winner
+
+    def __hash__(self):
+        # Same as Position.__hash__.
+        return self.hash
+
+    def __repr__(self):
+        return "BitboardPosition(" + repr(bytes(self.board)) + ", active=" + str(self.active) + ", winner=" + str(self.winner) + ")"
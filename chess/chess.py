@@ -1,6 +1,33 @@
+from .bitboard import BitboardPosition, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks
+from .tables import ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS, KNIGHT_STEPS, KING_STEPS, BETWEEN, ROOK_LINES, BISHOP_LINES
+from .zobrist import PIECE_KEYS, BLACK_TO_MOVE, move_keys
+from .encoding import encode, decode
+from .position import Position, square, piece_code, COLOR, KIND, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+# Move generation backends of the GameController. "objects" generates moves from the pieces and fields of the board.
+# The others keep a compact position with the same move rules in sync with the board and generate moves from it.
+BACKENDS = {"objects": None, "array": Position, "bitboard": BitboardPosition}
+
+def field_order(field):
+    """ Sort key for fields in the order they are printed (last row first, each row from left to right). """
+    return (7 - field.y) * 8 + field.x
+
 class GameController:
-    def __init__(self, init_pieces=True):
+    def __init__(self, init_pieces=True, backend="objects", legal=False):
+        """ backend: Move generation backend (see BACKENDS).
+            legal: Whether moves leaving the own king under attack are disallowed. The game is then won by checkmate
+                (a stalemated player just has no possible moves). Otherwise, the game is won by beating the enemy king.
+        """
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend: " + str(backend))
         self.game = Game()
+        self.game.legal = legal
+
+        # Move generation backend (see BACKENDS). The backend position is created on demand and kept in sync in move_piece.
+        self.backend = backend
+        self.backend_position = None
+        # Zobrist hash of the pieces on the board and the active player (see zobrist.py). Kept up to date in init_piece and move_piece.
+        self.hash = 0
 
         whitePlayer = Player("white")
         blackPlayer = Player("black")
@@ -38,14 +65,25 @@ class GameController:
     def init_piece(self, constructor, player, x, y):
         piece = constructor()
         piece.player = player
-        player.pieces.append(piece)
+        player.add_piece(piece)
         field = self.game.board.fields[x][y]
         piece.set_field(field)
+        self.hash ^= PIECE_KEYS[self.piece_code(piece)][square(x, y)]
+        self.backend_position = None
+        self.game.attack_maps_valid = False
 
     def remove_piece(self, x, y):
-        piece = self.game.board.fields[x][y].piece
-        player.pieces.remove(piece)
-        piece.set_field(None)
+        field = self.game.board.fields[x][y]
+        piece = field.piece
+        self.hash ^= PIECE_KEYS[self.piece_code(piece)][square(x, y)]
+        piece.player.remove_piece(piece)
+        field.set_piece(None)
+        self.backend_position = None
+        self.game.attack_maps_valid = False
+
+    def piece_code(self, piece):
+        """ Piece code of the compact Position representation. """
+        return piece_code(piece.kind, self.game.players.index(piece.player))
 
     def init_board(self):
         board = Board()
@@ -61,18 +99,19 @@ class GameController:
                 field.board = board
                 field.x = x
                 field.y = y
+                field.square = square(x, y)
+                field.bit = 1 << field.square
 
                 field_row.append(field)
             board.fields.append(field_row)
         return board
 
     def get_possible_piece_moves(self, piece):
-        possible_moves = []
-        for y in reversed(range(8)):
-            for x in range(8):
-                field = self.game.board.fields[x][y]
-                if piece.can_move_to(field):
-                    possible_moves.append(field)
+        """ Returns all fields the piece can be moved to.
+            The fields are ordered like the board is printed: from the last row to the first, each row from left to right.
+        """
+        possible_moves = list(piece.possible_moves())
+        possible_moves.sort(key=field_order)
         return possible_moves
 
     def print_possible_moves(self, piece):
@@ -93,10 +132,70 @@ class GameController:
         """ Returns all possible moves for the active player. 
             Returns a list of tuples (piece, moves) where moves is a list of fields where piece can be moved to.
         """
+        if self.backend != "objects":
+            possible_moves = self.get_backend_moves()
+        else:
+            possible_moves = []
+            player = self.game.activePlayer
+            for piece in player.piece_set:
+                moves = self.get_possible_piece_moves(piece)
+                possible_moves.append((piece, moves))
+        if self.game.legal:
+            return self.filter_legal_moves(possible_moves)
+        return possible_moves
+
+    def filter_legal_moves(self, possible_moves):
+        """ Removes the moves leaving the own king of the active player under attack from possible_moves (as returned by get_possible_moves).
+            Uses the attack maps, so no replies of the enemy are generated: in check, only moves beating or blocking the attacking piece are kept,
+            pinned pieces only move along the line to the pinning piece and the king only moves to fields not attacked.
+        """
+        game = self.game
+        player = game.activePlayer
+        king = player.king
+        if king is None:
+            return possible_moves
+        game.ensure_attack_maps()
+        checkers, pins = game.king_safety(player)
+        danger = game.king_danger(player)
+        if len(checkers) == 1:
+            checker = checkers[0]
+            # A knight is not on a line with the king (BETWEEN is None), it can only be beaten.
+            evasions = (BETWEEN[checker.field.square][king.field.square] or 0) | checker.field.bit
+        legal_moves = []
+        for piece, moves in possible_moves:
+            if piece is king:
+                moves = [field for field in moves if not field.bit & danger]
+            elif len(checkers) > 1:
+                moves = []
+            elif checkers or piece in pins:
+                allowed = evasions if checkers else -1
+                if piece in pins:
+                    allowed &= pins[piece]
+                moves = [field for field in moves if field.bit & allowed]
+            legal_moves.append((piece, moves))
+        return legal_moves
+
+    def is_in_check(self, player=None):
+        """ Whether the king of the player (by default the active player) is attacked. """
+        player = player or self.game.activePlayer
+        if player.king is None:
+            return False
+        self.game.ensure_attack_maps()
+        return self.game.opponent(player).attacks & player.king.field.bit != 0
+
+    def get_backend_moves(self):
+        """ Same as get_possible_moves, but the moves are generated by the backend position. """
+        if self.backend_position is None:
+            position = self.get_position()
+            self.backend_position = BACKENDS[self.backend](position.board, position.active, position.winner)
+        fields = self.game.board.fields
+        targets = {}
+        for start, target in self.backend_position.moves():
+            targets.setdefault(start, []).append(fields[target & 7][target >> 3])
         possible_moves = []
-        player = self.game.activePlayer
-        for piece in player.pieces:
-            moves = self.get_possible_piece_moves(piece)
+        for piece in self.game.activePlayer.piece_set:
+            moves = targets.get(square(piece.field.x, piece.field.y), [])
+            moves.sort(key=field_order)
             possible_moves.append((piece, moves))
         return possible_moves
 
@@ -125,16 +224,29 @@ class GameController:
         if check_possible_move and not piece.can_move_to(field):
             print("Move to field not possible°")
             return False
+        if check_possible_move and self.game.legal and not self.filter_legal_moves([(piece, [field])])[0][1]:
+            print("Move leaves the own king under attack.")
+            return False
         
+        start = piece.field
+        beaten_code = 0 if field.piece is None else self.piece_code(field.piece)
+        self.hash ^= move_keys(self.piece_code(piece), square(start.x, start.y), square(field.x, field.y), beaten_code)
+
         # Piece at the target location gets beaten.
         if field.piece is not None:
             beaten_piece = field.piece
             field.piece = None
-            beaten_piece.player.pieces.remove(beaten_piece)
+            beaten_piece.player.remove_piece(beaten_piece)
             self.game.beatenPieces.append(beaten_piece)
             if verbose:
                 print("Beaten piece")
         piece.set_field(field)
+        if self.backend_position is not None:
+            self.backend_position.make_move(square(start.x, start.y), square(field.x, field.y))
+            # The controller never unmakes moves, so the undo stack is not kept.
+            self.backend_position.history.clear()
+        if self.game.attack_maps_valid:
+            self.game.update_attacks(piece, start.bit | field.bit)
 
         # New active player.
         self.switch_active_player()
@@ -149,9 +261,12 @@ class GameController:
     def check_winner(self):
         if self.game.is_finished():
             for player in self.game.players:
-                for piece in player.pieces:
-                    if isinstance(piece, King):
-                        return player
+                if player.king is not None:
+                    return player
+        if self.game.legal and self.is_in_check():
+            # Checkmate: the active player has no move out of check.
+            if not any(moves for piece, moves in self.get_possible_moves()):
+                return self.game.opponent(self.game.activePlayer)
         return None
 
     def switch_active_player(self):
@@ -164,6 +279,44 @@ class GameController:
         from copy import deepcopy
         return deepcopy(self)
 
+    def get_position(self):
+        """ Returns the current game situation as a compact Position. """
+        board = bytearray(64)
+        for color, player in enumerate(self.game.players):
+            for piece in player.piece_set:
+                board[square(piece.field.x, piece.field.y)] = piece_code(piece.kind, color)
+        active = self.game.players.index(self.game.activePlayer)
+        winner = None if self.game.winner is None else self.game.players.index(self.game.winner)
+        return Position(board, active, winner)
+
+    def book_move(self, book):
+        """ The move of an opening book (book.OpeningBook) for the current game situation as start and target coordinates, or None if it is not in the book. """
+        return book.best_move(self.hash)
+
+    def to_encoding(self, binary=False):
+        """ Text (FEN style) or binary encoding of the game situation (see encoding.py). """
+        return encode(self.get_position(), binary)
+
+    @classmethod
+    def from_encoding(cls, encoding, backend="objects", legal=False):
+        """ Creates a game controller from a text (str) or binary (bytes) encoding (see encoding.py). """
+        return cls.from_position(decode(encoding), backend, legal)
+
+    @classmethod
+    def from_position(cls, position, backend="objects", legal=False):
+        """ Creates a game controller holding the game situation of a Position. """
+        ctl = cls(init_pieces=False, backend=backend, legal=legal)
+        players = ctl.game.players
+        for sq, code in enumerate(position.board):
+            if code != EMPTY:
+                ctl.init_piece(PIECE_TYPES[KIND[code]], players[COLOR[code]], sq & 7, sq >> 3)
+        ctl.game.activePlayer = players[position.active]
+        if position.active:
+            ctl.hash ^= BLACK_TO_MOVE
+        if position.winner is not None:
+            ctl.game.winner = players[position.winner]
+        return ctl
+
 class Game:
     def __init__(self):
         self.players = [] 
@@ -171,17 +324,86 @@ class Game:
         self.board = None
         self.winner = None
         self.beatenPieces = []
+        # Whether moves leaving the own king under attack are disallowed (see GameController).
+        self.legal = False
+        # Whether the attack maps (Piece.attacks and Player.attacks) are up to date. They are kept up to date in GameController.move_piece
+        # once they have been built (see ensure_attack_maps).
+        self.attack_maps_valid = False
     
     def is_finished(self):
         for player in self.players:
-            hasKing = False
-            for piece in player.pieces:
-                if isinstance(piece, King):
-                    hasKing = True
-                    break
-            if not hasKing:
+            if player.king is None:
                 return True
         return False
+
+    def opponent(self, player):
+        return self.players[1] if player is self.players[0] else self.players[0]
+
+    def ensure_attack_maps(self):
+        """ Builds the attack maps of all pieces and players, unless they are up to date. """
+        if self.attack_maps_valid:
+            return
+        occupied = self.board.occupied
+        for player in self.players:
+            attacks = 0
+            for piece in player.piece_set:
+                piece.attacks, piece.blockers = piece.compute_attacks(occupied)
+                attacks |= piece.attacks
+            player.attacks = attacks
+        self.attack_maps_valid = True
+
+    def update_attacks(self, moved_piece, changed):
+        """ Updates the attack maps after moved_piece moved. changed is the mask of the fields whose occupation changed.
+            Only the attacks of the moved piece and of pieces whose attacks depend on the changed fields (see Piece.blockers) are recomputed.
+        """
+        occupied = self.board.occupied
+        for player in self.players:
+            attacks = 0
+            for piece in player.piece_set:
+                if piece is moved_piece or piece.blockers & changed:
+                    piece.attacks, piece.blockers = piece.compute_attacks(occupied)
+                attacks |= piece.attacks
+            player.attacks = attacks
+
+    def king_danger(self, player):
+        """ Mask of the fields the king of player must not move to: the fields attacked by the enemy when the king is removed from the board
+            (so that the king cannot step back along the line of an attacking piece).
+        """
+        king_bit = player.king.field.bit
+        occupied = self.board.occupied & ~king_bit
+        danger = 0
+        for piece in self.opponent(player).piece_set:
+            if piece.blockers & king_bit:
+                danger |= piece.compute_attacks(occupied)[0]
+            else:
+                danger |= piece.attacks
+        return danger
+
+    def king_safety(self, player):
+        """ Returns the enemy pieces attacking the king of player, and the pinned pieces of player as a dict piece -> mask of the fields it may
+            move to without exposing the king (the fields between the king and the pinning piece and the pinning piece itself).
+        """
+        king = player.king
+        king_square = king.field.square
+        king_bit = king.field.bit
+        occupied = self.board.occupied
+        fields = self.board.fields
+        checkers = []
+        pins = {}
+        for piece in self.opponent(player).piece_set:
+            if piece.attacks & king_bit:
+                checkers.append(piece)
+            if not piece.line_attacks(king_bit):
+                continue
+            between = BETWEEN[piece.field.square][king_square]
+            blocking = between & occupied
+            # Exactly one piece between them, which belongs to player.
+            if blocking and not blocking & (blocking - 1):
+                sq = (blocking.bit_length() - 1)
+                pinned = fields[sq & 7][sq >> 3].piece
+                if pinned.player is player:
+                    pins[pinned] = between | piece.field.bit
+        return checkers, pins
     
     def status(self, field_names=False):
         status = ""
@@ -204,8 +426,31 @@ class Game:
 class Player:
     def __init__(self, color):
         self.color = color
-        self.pieces = [] 
+        # The pieces of the player as keys of an (insertion ordered) dict, so that a beaten piece is removed in O(1).
+        self.piece_set = {}
+        # One of the player's kings (None if the player has no king left).
+        self.king = None
         self.game = None
+        # Mask of the fields attacked by the player's pieces (see Game.ensure_attack_maps).
+        self.attacks = 0
+
+    @property
+    def pieces(self):
+        """ Tuple of the pieces of the player (in the order they were added). It is a snapshot: the pieces are changed with add_piece and
+            remove_piece, so that the king stays tracked. A tuple has no append or remove, so changing it fails instead of having no effect.
+        """
+        return tuple(self.piece_set)
+
+    def add_piece(self, piece):
+        self.piece_set[piece] = None
+        if self.king is None and isinstance(piece, King):
+            self.king = piece
+
+    def remove_piece(self, piece):
+        del self.piece_set[piece]
+        if piece is self.king:
+            # Usually a player has one king only. Otherwise, another king takes its place.
+            self.king = next((p for p in self.piece_set if isinstance(p, King)), None)
 
     def __str__(self):
         return self.color
@@ -215,6 +460,8 @@ class Board:
     def __init__(self):
         # Fields are two-dimensional and indexed by fields[x][y]. First is column (letters) then row. fields[0][0] is A1. fields[7][7] is H8.
         self.fields = []
+        # Bit mask of the occupied fields (bit = y*8 + x, see Field.bit). Kept up to date by Field.set_piece and Piece.set_field.
+        self.occupied = 0
 
     def is_space_free(self, start_field, target_field):
         # Start and target are the same. Return False (since this means, we cannot move).
@@ -225,47 +472,15 @@ class Board:
         if target_field.piece is not None and start_field.piece is not None and start_field.piece.player == target_field.piece.player:
             return False 
 
-
-        # Determine iterator "next_field", which gives the coordinates of the next field depending on movement in column, row or diagonal.
-        # Movement in same column
-        if start_field.x == target_field.x:
-            if target_field.y > start_field.y:
-                next_field = lambda x, y: (x, y+1)
-            else:
-                next_field = lambda x, y: (x, y-1)
-
-        # Movement in same row
-        if start_field.y == target_field.y:
-            if target_field.x > start_field.x:
-                next_field = lambda x, y: (x+1, y)
-            else:
-                next_field = lambda x, y: (x-1, y)
-
-        # Diagonal Movement in both directions
-        if abs(start_field.y - target_field.y) == abs(start_field.x - target_field.x):
-            if target_field.x > start_field.x:
-                if target_field.y > start_field.y:
-                    next_field = lambda x, y: (x+1, y+1)
-                else:
-                    next_field = lambda x, y: (x+1, y-1)
-            elif target_field.x < start_field.x:
-                if target_field.y > start_field.y:
-                    next_field = lambda x, y: (x-1, y+1)
-                else:
-                    next_field = lambda x, y: (x-1, y-1)
-
-        # Iterate over fields and find whether the space between start and target is free.
-        field = start_field
-        x, y = next_field(field.x, field.y)
-        field = self.fields[x][y]
-        while field != target_field:
-            # Piece is on field between start and target.
-            if field.piece is not None:
-                return False
-            x, y = next_field(field.x, field.y)
-            field = self.fields[x][y]
-        # Iterated up to the target field. Now space is free if target is free or enemy piece is on the space.
-        return field.piece is None or field.piece.player != start_field.piece.player
+        # The fields between start and target (in a column, row or diagonal) are looked up in a precomputed table.
+        # The space is free if none of them is occupied.
+        between = BETWEEN[start_field.square][target_field.square]
+        if between is None:
+            raise ValueError("Fields " + start_field.name + " and " + target_field.name + " are not in a column, row or diagonal.")
+        if between & self.occupied:
+            return False
+        # Now space is free if target is free or enemy piece is on the space.
+        return target_field.piece is None or target_field.piece.player != start_field.piece.player
            
 class Field:
     def __init__(self):
@@ -274,6 +489,9 @@ class Field:
         self.board = None
         self.x = 0 # (0,0) is A1, (7,7) is H8
         self.y = 0
+        # Square index y*8 + x and its bit in Board.occupied.
+        self.square = 0
+        self.bit = 1
     
     def set_piece(self, piece):
         # Remove previous association to self.
@@ -283,10 +501,12 @@ class Field:
         # Set association to None.
         if piece is None:
             self.piece = None
+            self.board.occupied &= ~self.bit
             return
 
         # Set new association with referential integrity.
         self.piece = piece
+        self.board.occupied |= self.bit
         if piece.field != self:
             piece.set_field(self)
     
@@ -295,16 +515,24 @@ class Field:
 
 class Piece:
     """ An abstract game piece. """
+    # Piece type code of the compact Position representation.
+    kind = None
+
     def __init__(self):
         self.player = None
         self.field = None
+        # Mask of the fields the piece attacks (including fields of own pieces it defends) and mask of the fields whose occupation
+        # determines its attacks. Kept up to date by Game.update_attacks while the attack maps are used.
+        self.attacks = 0
+        self.blockers = 0
 
     def set_field(self, field):
         if self.field is not None:
             self.field.piece = None
+            self.field.board.occupied &= ~self.field.bit
 
         if field is None:
-            self.piece = None
+            self.field = None
             return
 
         self.field = field
@@ -317,60 +545,203 @@ class Piece:
     def can_move_to(self, field):
         raise NotImplementedError
 
+    def compute_attacks(self, occupied):
+        """ Returns the attacks and blockers (see __init__) of the piece for the mask of occupied fields. """
+        raise NotImplementedError
+
+    def line_attacks(self, bit):
+        """ Whether the piece attacks the field of bit along a line on an empty board (i.e., it may pin a piece in between). """
+        return False
+
+    def possible_moves(self):
+        """ Generates the fields the piece can be moved to.
+            Subclasses generate their targets from the precomputed movement tables. This fallback checks every field.
+        """
+        for column in self.field.board.fields:
+            for field in column:
+                if self.can_move_to(field):
+                    yield field
+
+    def slide(self, rays):
+        """ Generates the targets along the given rays up to (and including) the first blocking enemy piece. """
+        fields = self.field.board.fields
+        for ray in rays[self.field.square]:
+            for sq in ray:
+                field = fields[sq & 7][sq >> 3]
+                if field.piece is None:
+                    yield field
+                    continue
+                if field.piece.player != self.player:
+                    yield field
+                break
+
     def symbol(self):
         raise NotImplementedError
 
 class Rook(Piece):
+    kind = ROOK
+
     def can_move_to(self, field):
-        return (field.x == self.field.x and field.y != self.field.y or field.y == self.field.y and field.x != self.field.x) and self.field.board.is_space_free(self.field, field)
+        return ROOK_LINES[self.field.square] & field.bit != 0 and self.field.board.is_space_free(self.field, field)
+
+    def possible_moves(self):
+        return self.slide(ROOK_RAYS)
+
+    def compute_attacks(self, occupied):
+        attacks = rook_attacks(self.field.square, occupied)
+        return attacks, attacks
+
+    def line_attacks(self, bit):
+        return ROOK_LINES[self.field.square] & bit != 0
 
     def symbol(self):
         return "\u2656" if self.player.color == "white" else "\u265C"
 
 class King(Piece):
+    kind = KING
+
     def can_move_to(self, field):
         diffX = abs(field.x - self.field.x)
         diffY = abs(field.y - self.field.y)
         freeField = field.piece is None or field.piece.player.color != self.player.color
         movementRules = (diffX == 1 and diffY == 0 or diffX == 0 and diffY == 1 or diffX == 1 and diffY == 1)
-        targetSafe = True # TODO
+        game = self.player.game
+        if freeField and movementRules and game.legal:
+            game.ensure_attack_maps()
+            targetSafe = not game.king_danger(self.player) & field.bit
+        else:
+            targetSafe = True
         return freeField and movementRules and targetSafe
 
+    def possible_moves(self):
+        fields = self.field.board.fields
+        for sq in KING_STEPS[self.field.square]:
+            field = fields[sq & 7][sq >> 3]
+            if field.piece is None or field.piece.player.color != self.player.color:
+                yield field
+
+    def compute_attacks(self, occupied):
+        return KING_ATTACKS[self.field.square], 0
+
     def symbol(self):
         return "\u2654" if self.player.color == "white" else "\u265A"
 
 class Pawn(Piece):
+    kind = PAWN
+
     def can_move_to(self, field):
         verticalMovement = self.field.x == field.x and (self.player.color == "white" and field.y == self.field.y+1 or self.player.color == "black" and field.y == self.field.y-1)
         initialMovement = self.field.x == field.x and (self.player.color == "white" and self.field.y == 1 and field.y == 3 or self.player.color == "black" and self.field.y == 6 and field.y == 4)
         beatenFigure = abs(self.field.x - field.x) == 1 and (self.player.color == "white" and field.y == self.field.y+1 or self.player.color == "black" and field.y == self.field.y-1) and field.piece is not None and field.piece.player != self.player
         return beatenFigure or (verticalMovement and field.piece is None or initialMovement and self.field.board.is_space_free(self.field, field))
 
+    def possible_moves(self):
+        fields = self.field.board.fields
+        x, y = self.field.x, self.field.y
+        white = self.player.color == "white"
+        direction = 1 if white else -1
+        y1 = y + direction
+        if not 0 <= y1 < 8:
+            return
+        # Beating a piece diagonally.
+        for x1 in (x - 1, x + 1):
+            if 0 <= x1 < 8:
+                field = fields[x1][y1]
+                if field.piece is not None and field.piece.player != self.player:
+                    yield field
+        # Moving one field forward.
+        field = fields[x][y1]
+        if field.piece is None:
+            yield field
+        # Initial movement of two fields. As in can_move_to, the target may hold an enemy piece.
+        if (y == 1 if white else y == 6) and field.piece is None:
+            field = fields[x][y1 + direction]
+            if field.piece is None or field.piece.player != self.player:
+                yield field
+
+    def compute_attacks(self, occupied):
+        # Beating diagonally, and with the initial movement of two fields, which may beat a piece if the field in between is free.
+        sq = self.field.square
+        white = self.player.color == "white"
+        attacks = PAWN_ATTACKS[0 if white else 1][sq]
+        if self.field.y == (1 if white else 6):
+            between = 1 << (sq + 8 if white else sq - 8)
+            if not occupied & between:
+                attacks |= 1 << (sq + 16 if white else sq - 16)
+            return attacks, between
+        return attacks, 0
+
+    def line_attacks(self, bit):
+        # The initial movement of two fields beats a piece behind a single field.
+        sq = self.field.square
+        if self.field.y == 1 and self.player.color == "white":
+            return 1 << (sq + 16) == bit
+        if self.field.y == 6 and self.player.color != "white":
+            return 1 << (sq - 16) == bit
+        return False
+
     def symbol(self):
         return "\u2659" if self.player.color == "white" else "\u265F"
 
 class Knight(Piece):
+    kind = KNIGHT
+
     def can_move_to(self, field):
         diffX = abs(field.x - self.field.x)
         diffY = abs(field.y - self.field.y)
         return (field.piece is None or field.piece.player != self.player) and (diffX == 2 and diffY == 1 or diffX == 1 and diffY == 2)
 
+    def possible_moves(self):
+        fields = self.field.board.fields
+        for sq in KNIGHT_STEPS[self.field.square]:
+            field = fields[sq & 7][sq >> 3]
+            if field.piece is None or field.piece.player != self.player:
+                yield field
+
+    def compute_attacks(self, occupied):
+        return KNIGHT_ATTACKS[self.field.square], 0
+
     def symbol(self):
         return "\u2658" if self.player.color == "white" else "\u265E"
 
 class Bishop(Piece):
+    kind = BISHOP
+
     def can_move_to(self, field):
-        return abs(field.x - self.field.x) == abs(field.y - self.field.y) and field != self.field and self.field.board.is_space_free(self.field, field)
+        return BISHOP_LINES[self.field.square] & field.bit != 0 and self.field.board.is_space_free(self.field, field)
+
+    def possible_moves(self):
+        return self.slide(BISHOP_RAYS)
+
+    def compute_attacks(self, occupied):
+        attacks = bishop_attacks(self.field.square, occupied)
+        return attacks, attacks
+
+    def line_attacks(self, bit):
+        return BISHOP_LINES[self.field.square] & bit != 0
 
     def symbol(self):
         return "\u2657" if self.player.color == "white" else "\u265D"
 
 class Queen(Piece):
+    kind = QUEEN
+
     def can_move_to(self,field):
-        diagonalMovement = abs(field.x - self.field.x) == abs(field.y - self.field.y) and field != self.field 
-        verticalMovement = (field.x == self.field.x and field.y != self.field.y or field.y == self.field.y and field.x != self.field.x)
-        return (diagonalMovement or verticalMovement) and self.field.board.is_space_free(self.field, field)
+        return (ROOK_LINES[self.field.square] | BISHOP_LINES[self.field.square]) & field.bit != 0 and self.field.board.is_space_free(self.field, field)
+
+    def possible_moves(self):
+        return self.slide(QUEEN_RAYS)
+
+    def compute_attacks(self, occupied):
+        sq = self.field.square
+        attacks = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+        return attacks, attacks
+
+    def line_attacks(self, bit):
+        return (ROOK_LINES[self.field.square] | BISHOP_LINES[self.field.square]) & bit != 0
 
     def symbol(self):
         return "\u2655" if self.player.color == "white" else "\u265B"
 
+# Piece classes by piece type code of the compact Position representation.
+PIECE_TYPES = {PAWN: Pawn, KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen, KING: King}
@@ -1,39 +1,67 @@
+from .chess import GameController
+from .position import coordinates, square
+
 class GameControllerAdapter:
-    def __init__(self, ctl):
-        self.ctl = ctl
+    """ Game state for MCTS.
+        The game situation is held as a compact Position, so subsequent states are cheap copies of 64 bytes instead of deep copies of the GameController.
+        The GameController passed in is only read once. The ctl attribute gives a GameController view of the state (created on first access).
+    """
+    def __init__(self, ctl=None, position=None):
+        if position is None:
+            position = ctl.get_position()
+        self.position = position
+        self._ctl = ctl
+
+    def __getstate__(self):
+        # Only the compact position is pickled (e.g., when sent to worker processes). The GameController view is rebuilt on demand.
+        return {"position": self.position, "_ctl": None}
+
+    @property
+    def ctl(self):
+        if self._ctl is None:
+            self._ctl = GameController.from_position(self.position)
+        return self._ctl
     
+    def key(self):
+        """ Zobrist hash of the game situation. Equal game situations have equal keys. """
+        return self.position.hash
+
     def is_final(self):
-        return self.ctl.game.winner != None
+        return self.position.winner is not None
     
     def successors(self):
-        # Actions consist of pairs of pieces and target fields.
-        # Beware that actions are valid only for the specific game state instance!
-        # I.e., we cannot execute this action on a different instance of the same game state.
-        # Instead, we need to use the coordinates of the start- and target field.
+        # Actions consist of pairs of start and target coordinates ((xs, ys), (xt, yt)).
+        # They are valid for any instance of the same game state.
         successors = []
-        actions = self.ctl.get_possible_moves()
-        for action in actions:
-            piece, targets = action
-            for target in targets:
-                newState = self.ctl.get_deep_copy()
-                newState.move(piece.coordinates(), target.coordinates(), verbose=False)
-                newState = GameControllerAdapter(newState)
-                successors.append((newState, (piece, target)))
+        for start, target in self.position.moves():
+            newState = self.position.copy()
+            newState.make_move(start, target)
+            newState = GameControllerAdapter(position=newState)
+            successors.append((newState, (coordinates(start), coordinates(target))))
         return successors
     
+    def moves(self):
+        """ Returns the possible moves as pairs of start and target coordinates ((xs, ys), (xt, yt)) without creating any states. """
+        return [(coordinates(start), coordinates(target)) for start, target in self.position.moves()]
+
+    def successor(self, move):
+        """ The state after a move ((xs, ys), (xt, yt)). The move is not checked. """
+        (xs, ys), (xt, yt) = move
+        newState = self.position.copy()
+        newState.make_move(square(xs, ys), square(xt, yt))
+        return GameControllerAdapter(position=newState)
+
     def perform_random_action(self):
-        moves = self.ctl.get_possible_moves()
-        moves = [(piece, target) for piece, targets in moves for target in targets]
+        moves = self.position.moves()
         import random
-        random_move = random.choice(moves)
-        newState = self.ctl.get_deep_copy()
-        piece, target = random_move
-        newState.move(piece.coordinates(), target.coordinates(), verbose=False)
-        return GameControllerAdapter(newState)
+        start, target = random.choice(moves)
+        newState = self.position.copy()
+        newState.make_move(start, target)
+        return GameControllerAdapter(position=newState)
     
     def winner(self, i):
         # Even node levels of the game tree correspond to the black player.
-        player_to_value = self.ctl.game.players[(i+1)%2]
-        if self.ctl.game.winner is None:
+        player_to_value = (i+1)%2
+        if self.position.winner is None:
             raise Exception("Game not finished yet.")
-        return player_to_value == self.ctl.game.winner
+        return player_to_value == self.position.winner
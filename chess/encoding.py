@@ -0,0 +1,182 @@
+# Compact encodings of game situations.
+# The text encoding is the piece placement and active color of FEN, e.g. "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w":
+# the rows from 8 to 1, each from A to H, white pieces in upper case, runs of empty fields as digits. There is no castling or en passant.
+# The binary encoding has BINARY_SIZE (33) bytes: the 64 piece codes of position.py as 4-bit nibbles (square 2i in the low and square 2i + 1
+# in the high nibble of byte i), followed by a byte with the active player in bit 0 and the winner (0 none, 1 white, 2 black) in bits 1-2.
+# In the text encoding, the winner follows from the kings: a player without king has lost.
+# Files of positions are either text (one encoding per line) or binary (consecutive binary encodings), see write_positions and read_positions.
+import os
+
+import numpy as np
+
+from .position import Position, WHITE, BLACK, KING, BLACK_OFFSET, EMPTY, piece_code, square
+
+BINARY_SIZE = 33
+
+PIECE_LETTERS = "PNBRQK"
+# Letter by piece code and piece code by letter.
+LETTERS = (None,) + tuple(PIECE_LETTERS) + tuple(PIECE_LETTERS.lower())
+CODES = {letter: code for code, letter in enumerate(LETTERS) if letter is not None}
+
+# Low and high nibble of every byte value, as translation tables for bytes.translate.
+LOW_NIBBLES = bytes(value & 15 for value in range(256))
+HIGH_NIBBLES = bytes(value >> 4 for value in range(256))
+
+def winner_of(board):
+    """ The winner of a board (None if both players have a king). """
+    white_king = piece_code(KING, WHITE) in board
+    black_king = piece_code(KING, BLACK) in board
+    if white_king == black_king:
+        return None
+    return WHITE if white_king else BLACK
+
+def encode_text(board, active):
+    rows = []
+    for y in range(7, -1, -1):
+        row = ""
+        empty = 0
+        for x in range(8):
+            code = board[square(x, y)]
+            if code == EMPTY:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            row += LETTERS[code]
+        if empty:
+            row += str(empty)
+        rows.append(row)
+    return "/".join(rows) + (" w" if active == WHITE else " b")
+
+def decode_text(text):
+    """ Returns the board (a bytearray of 64 piece codes) and the active player of a text encoding. Raises ValueError if it is invalid. """
+    fields = text.split()
+    if not 1 <= len(fields) <= 2 or len(fields) == 2 and fields[1] not in ("w", "b"):
+        raise ValueError(f"Invalid position encoding: {text!r}")
+    rows = fields[0].split("/")
+    if len(rows) != 8:
+        raise ValueError(f"Invalid position encoding (8 rows expected): {text!r}")
+    board = bytearray(64)
+    for i, row in enumerate(rows):
+        y = 7 - i
+        x = 0
+        for char in row:
+            if char.isdigit():
+                x += int(char)
+            elif char in CODES and x < 8:
+                board[square(x, y)] = CODES[char]
+                x += 1
+            else:
+                x = 9
+                break
+        if x != 8:
+            raise ValueError(f"Invalid row {row!r} in position encoding: {text!r}")
+    active = BLACK if len(fields) == 2 and fields[1] == "b" else WHITE
+    return board, active
+
+def encode_binary(board, active, winner):
+    data = bytearray(BINARY_SIZE)
+    data[:32] = bytes(board[i] | board[i + 1] << 4 for i in range(0, 64, 2))
+    data[32] = active | (0 if winner is None else winner + 1) << 1
+    return bytes(data)
+
+def decode_binary(data, board=None):
+    """ Returns the board, the active player and the winner of a binary encoding. The board is written into board (a bytearray) if given. """
+    if len(data) != BINARY_SIZE:
+        raise ValueError(f"A binary position encoding has {BINARY_SIZE} bytes.")
+    nibbles = bytes(data[:32])
+    if board is None:
+        board = bytearray(64)
+    board[0::2] = nibbles.translate(LOW_NIBBLES)
+    board[1::2] = nibbles.translate(HIGH_NIBBLES)
+    if max(board) > 2 * BLACK_OFFSET:
+        raise ValueError("Invalid piece code in binary position encoding.")
+    flags = data[32]
+    winner = (flags >> 1 & 3) - 1
+    if winner > BLACK:
+        raise ValueError("Invalid winner in binary position encoding.")
+    return board, flags & 1, None if winner < 0 else winner
+
+def encode(position, binary=False):
+    """ Text or binary encoding of a Position. """
+    if binary:
+        return encode_binary(position.board, position.active, position.winner)
+    return encode_text(position.board, position.active)
+
+def decode(encoding):
+    """ Position of a text (str) or binary (bytes) encoding. """
+    if isinstance(encoding, str):
+        board, active = decode_text(encoding)
+        return Position(board, active, winner_of(board))
+    board, active, winner = decode_binary(encoding)
+    return Position(board, active, winner)
+
+def write_positions(path, positions, binary=True):
+    """ Writes the positions to a file of binary encodings, or of text encodings (one per line). """
+    with open(path, "wb" if binary else "w") as f:
+        for position in positions:
+            if binary:
+                f.write(encode(position, binary=True))
+            else:
+                f.write(encode(position) + "\n")
+
+def read_positions(path, binary=True, reuse=False, chunk_size=4096):
+    """ Generates the positions of a file written by write_positions. The file is read in chunks of chunk_size positions.
+        With reuse, the same Position object is yielded every time (loaded with the next position), so nothing is allocated per position.
+        Then, a position must be copied if it is kept.
+    """
+    position = Position() if reuse else None
+    board = position.board if reuse else None
+    if binary:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size * BINARY_SIZE)
+                if not chunk:
+                    break
+                if len(chunk) % BINARY_SIZE:
+                    raise ValueError(f"{path} is not a file of binary position encodings.")
+                view = memoryview(chunk)
+                for offset in range(0, len(chunk), BINARY_SIZE):
+                    if reuse:
+                        board, active, winner = decode_binary(view[offset:offset + BINARY_SIZE], board)
+                        position.load(board, active, winner)
+                        yield position
+                    else:
+                        board, active, winner = decode_binary(view[offset:offset + BINARY_SIZE])
+                        yield Position(board, active, winner)
+    else:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if reuse:
+                    decoded, active = decode_text(line)
+                    board[:] = decoded
+                    position.load(board, active, winner_of(board))
+                    yield position
+                else:
+                    yield decode(line)
+
+def read_boards(path):
+    """ The boards of a file of binary encodings as an N×64 NumPy array of piece codes, and the active players and winners (-1 for none)
+        as arrays of length N. The file is memory-mapped and decoded in a few vectorized operations.
+        Raises ValueError if the file holds invalid encodings.
+    """
+    size = os.path.getsize(path)
+    if size % BINARY_SIZE:
+        raise ValueError(f"{path} is not a file of binary position encodings.")
+    if size == 0:
+        # An empty file cannot be memory-mapped.
+        return np.empty((0, 64), dtype=np.uint8), np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int8)
+    data = np.memmap(path, dtype=np.uint8, mode="r").reshape(-1, BINARY_SIZE)
+    boards = np.empty((len(data), 64), dtype=np.uint8)
+    boards[:, 0::2] = data[:, :32] & 15
+    boards[:, 1::2] = data[:, :32] >> 4
+    if boards.max() > 2 * BLACK_OFFSET:
+        raise ValueError("Invalid piece code in binary position encoding.")
+    flags = data[:, 32]
+    winners = ((flags >> 1) & 3).astype(np.int8) - 1
+    if winners.max() > BLACK:
+        raise ValueError("Invalid winner in binary position encoding.")
+    return boards, (flags & 1).astype(np.int8), winners
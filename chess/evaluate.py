@@ -0,0 +1,156 @@
+# Batched static evaluation of positions with NumPy, as an alternative to random playouts in MCTS.
+# Positions are encoded as an N×64 array of piece codes (see position.py, e.g. from boards_array or encoding.read_boards) and scored in one
+# vectorized pass: material and piece-square values (one table lookup per square) plus mobility (the target squares of knights, bishops,
+# rooks and queens, found by stepping all pieces of the batch along their directions at once).
+# The score in centipawns (positive if white is better) is turned into a win probability of white with a logistic curve.
+import numpy as np
+
+from .position import WHITE, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK_OFFSET
+from .tables import ROOK_DIRECTIONS, BISHOP_DIRECTIONS, QUEEN_DIRECTIONS, KNIGHT_OFFSETS
+
+# Material values of the piece types in centipawns. The king is not counted, a position without king is final.
+MATERIAL = {PAWN: 100, KNIGHT: 300, BISHOP: 310, ROOK: 500, QUEEN: 900, KING: 0}
+# Centipawns per target square of a piece.
+MOBILITY_WEIGHT = 4
+# Score difference (in centipawns) at which the stronger side wins with probability 10/11 (as in the Elo formula).
+SCALE = 400
+
+def piece_square_bonus(kind, x, y):
+    """ Positional bonus in centipawns of a white piece of kind on (x, y). """
+    # 0 on the edge, 3 on the four center squares.
+    center = 3 - max(abs(2 * x - 7), abs(2 * y - 7)) // 2
+    if kind == PAWN:
+        return 10 * (y - 1) + (5 * center if 2 <= y <= 5 else 0)
+    if kind in (KNIGHT, BISHOP):
+        return 10 * center
+    if kind == KING:
+        # The king stays behind its pawns.
+        return 10 * (1 - y) if y < 2 else -20
+    return 0
+
+def value_table(piece_square=True):
+    """ Value in centipawns by piece code and square (13×64): positive for white, negative for black pieces. Black tables are mirrored. """
+    table = np.zeros((2 * BLACK_OFFSET + 1, 64), dtype=np.float64)
+    for kind, material in MATERIAL.items():
+        for sq in range(64):
+            x, y = sq % 8, sq // 8
+            table[kind, sq] = material + (piece_square_bonus(kind, x, y) if piece_square else 0)
+            table[kind + BLACK_OFFSET, sq] = -(material + (piece_square_bonus(kind, x, 7 - y) if piece_square else 0))
+    return table
+
+# Square index for "off the board". Boards are padded with one extra square holding OFF_BOARD, so stepping off the board needs no masking.
+OFF = 64
+OFF_BOARD = 255
+
+def step_table(offsets):
+    """ For every offset (dx, dy), the square one step from every square (OFF if it leaves the board, and from OFF). """
+    table = np.full((len(offsets), 65), OFF, dtype=np.intp)
+    for d, (dx, dy) in enumerate(offsets):
+        for sq in range(64):
+            x, y = sq % 8 + dx, sq // 8 + dy
+            if 0 <= x < 8 and 0 <= y < 8:
+                table[d, sq] = y * 8 + x
+    return table
+
+SLIDER_DIRECTIONS = QUEEN_DIRECTIONS
+SLIDER_STEPS = step_table(SLIDER_DIRECTIONS)
+# Transposed, so that KNIGHT_TARGETS[sq] are the (up to eight) target squares of a knight on sq.
+KNIGHT_TARGETS = step_table(KNIGHT_OFFSETS).T.copy()
+
+# Directions by piece code: whether a piece moves along the slider direction.
+SLIDES = np.zeros((256, len(SLIDER_DIRECTIONS)), dtype=bool)
+for kind, directions in ((ROOK, ROOK_DIRECTIONS), (BISHOP, BISHOP_DIRECTIONS), (QUEEN, SLIDER_DIRECTIONS)):
+    for code in (kind, kind + BLACK_OFFSET):
+        SLIDES[code] = [direction in directions for direction in SLIDER_DIRECTIONS]
+
+# Side by piece code: 0 white, 1 black, 2 empty, 3 off the board.
+EMPTY_SIDE = 2
+SIDES = np.full(256, 3, dtype=np.int8)
+SIDES[0] = EMPTY_SIDE
+SIDES[1:BLACK_OFFSET + 1] = WHITE
+SIDES[BLACK_OFFSET + 1:2 * BLACK_OFFSET + 1] = 1
+IS_KNIGHT = np.zeros(256, dtype=bool)
+IS_KNIGHT[[KNIGHT, KNIGHT + BLACK_OFFSET]] = True
+IS_SLIDER = SLIDES.any(axis=1)
+
+def boards_array(positions):
+    """ The boards of positions (holding a bytearray board) as an N×64 uint8 array of piece codes. """
+    return np.frombuffer(b"".join(position.board for position in positions), dtype=np.uint8).reshape(-1, 64)
+
+def one_hot(boards):
+    """ The N×12×64 one-hot encoding of an N×64 array of piece codes (plane code - 1 is set where the piece is). """
+    return (boards[:, None, :] == np.arange(1, 2 * BLACK_OFFSET + 1, dtype=np.uint8)[None, :, None]).astype(np.uint8)
+
+def mobility(boards):
+    """ Number of target squares (empty or beaten) of the white minus the black knights, bishops, rooks and queens, per board.
+        Moves leaving the king in check are counted as well.
+    """
+    n = len(boards)
+    padded = np.full((n, 65), OFF_BOARD, dtype=np.uint8)
+    padded[:, :64] = boards
+    sides = SIDES[padded].ravel()
+    # Every reached square is counted in counts[65 * board + side of the piece].
+    counts = np.zeros(65 * n, dtype=np.intp)
+
+    rows, squares = np.nonzero(IS_KNIGHT[boards])
+    offsets = rows * 65
+    own = SIDES[boards[rows, squares]]
+    targets = sides[offsets[:, None] + KNIGHT_TARGETS[squares]]
+    counts += np.bincount(offsets + own, ((targets != own[:, None]) & (targets != 3)).sum(axis=1), minlength=65 * n).astype(np.intp)
+
+    # All rays of all sliders are followed at once, one step per iteration. A ray ends at the first square that is not empty.
+    rows, squares = np.nonzero(IS_SLIDER[boards])
+    codes = boards[rows, squares]
+    pieces, directions = np.nonzero(SLIDES[codes])
+    offsets = rows[pieces] * 65
+    own = SIDES[codes[pieces]]
+    squares = squares[pieces]
+    keys = offsets + own
+    reached = []
+    for k in range(7):
+        squares = SLIDER_STEPS[directions, squares]
+        targets = sides[offsets + squares]
+        reached.append(keys[(targets != own) & (targets != 3)])
+        empty = targets == EMPTY_SIDE
+        if not empty.any():
+            break
+        offsets, own, keys, squares, directions = offsets[empty], own[empty], keys[empty], squares[empty], directions[empty]
+    if reached:
+        counts += np.bincount(np.concatenate(reached), minlength=65 * n)
+    counts = counts.reshape(n, 65)
+    return counts[:, WHITE] - counts[:, 1]
+
+class Evaluator:
+    """ Scores batches of positions. Pass it to MCTS (evaluator=...) to evaluate the selected leaves in batches instead of running playouts.
+        mobility_weight: Centipawns per target square (0 to skip the mobility term).
+        scale: Centipawns at which the stronger side wins with probability 10/11.
+        piece_square: Whether to add the piece-square bonuses to the material.
+    """
+    def __init__(self, mobility_weight=MOBILITY_WEIGHT, scale=SCALE, piece_square=True):
+        self.mobility_weight = mobility_weight
+        self.scale = scale
+        self.values = value_table(piece_square)
+
+    def evaluate(self, boards):
+        """ Score in centipawns (positive if white is better) of every board of an N×64 array of piece codes. """
+        boards = np.asarray(boards, dtype=np.uint8)
+        scores = self.values[boards, np.arange(64)].sum(axis=1)
+        if self.mobility_weight:
+            scores += self.mobility_weight * mobility(boards)
+        return scores
+
+    def win_probabilities(self, boards):
+        """ Probability that white wins, for every board of an N×64 array of piece codes. """
+        return 1 / (1 + 10 ** (-self.evaluate(boards) / self.scale))
+
+    def __call__(self, states, levels):
+        """ For game states (holding a Position) and node levels, returns the probability that the player of node level i has won
+            (see GameControllerAdapter.winner) as an array. Final states score 1 or 0.
+        """
+        positions = [state.position for state in states]
+        white = self.win_probabilities(boards_array(positions))
+        for k, position in enumerate(positions):
+            if position.winner is not None:
+                white[k] = 1.0 if position.winner == WHITE else 0.0
+        # Odd node levels correspond to white.
+        return np.where(np.asarray(levels) % 2 == 1, white, 1 - white)
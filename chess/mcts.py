@@ -1,136 +1,784 @@
+import json
+import logging
+import math
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
 from .chess import GameController, Game
 
-def shuffle(l):
-    import random
-    result = l[:]
-    random.shuffle(result)
-    return result
+logger = logging.getLogger(__name__)
+
+# Exploration constant of the UCT.
+UCT_C = math.sqrt(2)
+
+# Number of simulations added to the nodes on the path of a selected leaf while its simulation is pending (see MCTS.run_batch).
+VIRTUAL_LOSS = 1
+
+def playout(state, i, verbose=False):
+    """ Simulate a random playout from state and return whether the player of node level i has won.
+        This is a module level function, so it can be run in worker processes.
+    """
+    return counted_playout(state, i, verbose)[0]
+
+def counted_playout(state, i, verbose=False):
+    """ Same as playout, but returns a pair of the result and the number of plies played. """
+    plies = 0
+    while not state.is_final():
+        state = state.perform_random_action()
+        plies += 1
+        if verbose:
+            print(state.ctl.game.status())
+    return state.winner(i), plies
+
+# How many iterations of MCTS.run pass between two checks of the memory limit.
+MEMORY_CHECK_EVERY = 64
+
+def memory_mb():
+    """ Current resident memory of the process in MB (the peak resident memory where /proc is not available). """
+    import os
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere.
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+# Estimated memory in bytes of a node (with its entry in the ChildList of its parent) and of a game state (a GameControllerAdapter),
+# measured with tracemalloc. Used for the byte budget of MCTS.
+NODE_BYTES = 330
+STATE_BYTES = 500
+# When the tree exceeds its budget, it is reduced to this fraction of the budget.
+EVICTION_TARGET = 0.75
+
+class SearchStats:
+    """ Counters and timings of MCTS.run, collected when run is called with stats.
+        seconds: Time spent per phase (selection, expansion, simulation, backpropagation).
+        iterations: Number of simulations run.
+        nodes: Number of nodes added to the tree.
+        state_copies: Number of game states created (for nodes and, per ply or per rollout, in simulations).
+        rollouts, rollout_plies: Number of simulations and their plies (not known for simulations run in an executor).
+        max_depth: Maximum depth of a simulated node below the current node.
+        elapsed: Wall time of the runs in seconds.
+    """
+    PHASES = ("selection", "expansion", "simulation", "backpropagation")
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.iterations = 0
+        self.nodes = 0
+        self.state_copies = 0
+        self.rollouts = 0
+        self.rollout_plies = 0
+        self.max_depth = 0
+        self.elapsed = 0.0
+
+    def average_rollout_length(self):
+        return self.rollout_plies / self.rollouts if self.rollouts else 0.0
+
+    def iterations_per_second(self):
+        return self.iterations / self.elapsed if self.elapsed else 0.0
+
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "iterations": self.iterations,
+            "nodes": self.nodes,
+            "state_copies": self.state_copies,
+            "average_rollout_length": self.average_rollout_length(),
+            "max_depth": self.max_depth,
+            "elapsed": self.elapsed,
+            "iterations_per_second": self.iterations_per_second(),
+            "nodes_per_second": self.nodes_per_second(),
+            "seconds": dict(self.seconds),
+        }
+
+    def __repr__(self):
+        return "SearchStats(" + json.dumps(self.as_dict()) + ")"
+
+class SearchResult:
+    """ Result of MCTS.run.
+        simulations: Number of simulations run.
+        nodes: Number of nodes added to the tree.
+        elapsed: Run time in seconds.
+        best_move: Move of the best child node of the current node (None if it has no children).
+        stop_reason: The limit that ended the search ("simulations", "time", "nodes", "memory" or "stopped"), or "book" for a book move.
+        stats: The SearchStats of the run (None if no stats were collected).
+    """
+    def __init__(self, simulations, nodes, elapsed, best_move, stop_reason, stats=None):
+        self.simulations = simulations
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.best_move = best_move
+        self.stop_reason = stop_reason
+        self.stats = stats
+
+    def __repr__(self):
+        return f"SearchResult(simulations={self.simulations}, nodes={self.nodes}, elapsed={self.elapsed:.3f}, best_move={self.best_move}, stop_reason={self.stop_reason!r})"
 
 class MCTS:
     """ Implementation of Monte Carlo Tree Search.
         The current game state is passed to this.
         A game state must implement the following methods:
         is_final() - Returns true, if the game is in a final state, where no further moves can be done.
-        successors() - Returns possible subsequent states together with the moves that led to them (i.e., a list of pairs (state, move)). 
+        moves() - Returns the possible moves (e.g., pairs of start and target coordinates).
+        successor(move) - Returns the state after the move.
         perform_random_action() - Do a random action and return the state.
         winner(i) - Whether the player (depending on the node level i) has won the game or not.
+        key() - Only needed with a transposition table. A hash of the game state (equal states have equal keys).
+
+        Child nodes are created from the moves only. The state of a child node is created when the node is reached for the first time.
     """
-    def __init__(self, state):
+    def __init__(self, state, transposition_table=None, widening=None, rollout=None, book=None, node_level=0, max_tree_nodes=None, max_tree_bytes=None,
+                 evaluator=None):
         # The full tree (i.e., also nodes that have been already done).
-        # Using this, we can save the tree for future games.
+        # Using this, we can save the tree for future games (see save and load).
         # Not using this, we can save memory.
         # For now, we use it.
         self.tree = Node(state)
+        # The node level of the root determines the player of winner(i). For a GameControllerAdapter, it has to be 1 if black is active.
+        self.tree.node_level = node_level
         # The current game state.
         self.node = self.tree 
+        # Optional TranspositionTable. Nodes of equal game states on the same level then share their state and child nodes,
+        # which turns the tree into a directed acyclic graph.
+        self.transposition_table = transposition_table
+        # Nodes from the current node down to the node selected last. Results are backpropagated along this path.
+        self.path = []
+        # Number of nodes added to the tree by expansion.
+        self.n_nodes = 0
+        # Number of node states created.
+        self.n_states = 0
+        # Optional progressive widening as a pair (k, alpha): a node with N simulations has at most max(1, k * N**alpha) child nodes.
+        # Further child nodes (up to n_children) are added when the node has been simulated more often.
+        self.widening = widening
+        # Optional simulation function rollout(state, i) returning whether the player of node level i has won (e.g., a rollout.Rollout).
+        # By default, random actions are performed on the state up to the end of the game (see playout).
+        self.rollout = rollout
+        # Optional book.OpeningBook. If the current state is in the book, run returns the book move without searching.
+        self.book = book
+        # Optional budget of the tree below the current node, as a number of nodes and/or an estimated number of bytes (see NODE_BYTES and STATE_BYTES).
+        # When it is exceeded during run, the states of interior nodes are dropped (they are replayed from the moves when needed again)
+        # and, if that does not suffice, the subtrees of the least simulated nodes are evicted (see enforce_budget).
+        self.max_tree_nodes = max_tree_nodes
+        self.max_tree_bytes = max_tree_bytes
+        # Number of nodes and (approximately) of states in the tree below the current node. Updated when nodes are added, states are created
+        # or dropped and subtrees are evicted, recounted by advance.
+        self.tree_nodes = 1
+        self.tree_states = 1
+        # Nodes and bytes by which enforce_budget could not reduce the tree below EVICTION_TARGET of the budget (the current node and its
+        # child nodes are never evicted). They do not count against the budget, so the tree is only reduced again once it has grown.
+        self.budget_excess = (0, 0)
+        # Number of nodes evicted and of states dropped by enforce_budget.
+        self.n_evicted = 0
+        self.n_dropped_states = 0
+        # Optional batch evaluation function evaluator(states, levels) returning, for every state, the probability that the player of its
+        # node level wins (e.g., an evaluate.Evaluator). It replaces the simulation: the selected leaves are evaluated in batches of
+        # n_leaves (see run_batch) and the scores are backpropagated like fractional wins.
+        self.evaluator = evaluator
 
     def selection(self):
         """ Starting from the current game state, the root node R, select a leaf node L from which to expand the game tree. """
-        import random
         l = self.node
+        path = [l]
         while l.has_children():
-            max_score, max_child = -1, None
-            for child in shuffle(l.children):
-                score = child.get_uct()
-                if score > max_score:
-                    max_score = score
-                    max_child = child
-            l = max_child
+            if l.untried and len(l.children) < self.max_children(l):
+                # Progressive widening: add the next child node and select it as the leaf.
+                l = self.add_children(l, 1)
+                path.append(self.reach(l))
+                break
+            l = l.children[l.children.best_uct(l.simulations)]
+            path.append(self.reach(l))
+        self.path = path
         return l 
 
+    def reach(self, node):
+        """ Creates the state of a node reached for the first time and, with a transposition table, shares it with equal nodes. """
+        if not node.has_state():
+            node.materialize()
+            self.n_states += 1
+            self.tree_states += 1
+            # A node whose state was dropped (see enforce_budget) keeps its own child nodes.
+            if self.transposition_table is not None and not node.children:
+                self.transposition_table.share(node)
+        return node
+
+    def max_children(self, l):
+        """ The number of child nodes l may have under progressive widening. """
+        k, alpha = self.widening
+        return max(1, int(k * l.simulations**alpha))
+
+    def add_children(self, l, n):
+        """ Adds child nodes for the next n untried moves of l and returns the last one. """
+        moves = l.untried
+        self.n_nodes += n
+        self.tree_nodes += n
+        l.child_list().reserve(len(l.children) + n)
+        for i in range(n):
+            c = Node(None, move=moves.pop())
+            l.add_child(c)
+        if not moves:
+            l.untried = None
+        return c
+
     def expansion(self, l, n_children = 3):
         """ Expand the game tree to a new node C, if the selected leave node is not from a final state. """
-        import random
         if not l.state.is_final():
-            possible_moves = l.state.successors()
-            next_states = random.sample(possible_moves, k=min(len(possible_moves), n_children))
-            for next_state, move in next_states:
-                c = Node(next_state)
-                c.move = move
-                l.add_child(c)
-            return c
+            possible_moves = l.state.moves()
+            l.untried = random.sample(possible_moves, k=min(len(possible_moves), n_children))
+            n = len(l.untried) if self.widening is None else min(len(l.untried), self.max_children(l))
+            return self.reach(self.add_children(l, n))
         return None
 
     def simulation(self, c, verbose=False):
-        """ Simulate a random playout from C. """
-        state = c.state
-        i = c.node_level
-        while not state.is_final():
-            state = state.perform_random_action()
-            if verbose:
-                print(state.ctl.game.status())
-        winner = state.winner(i)
-        return winner
+        """ Simulate a playout from C with the rollout, or a random playout without one.
+            verbose prints the states of a random playout. It does not change the simulation: a rollout is used either way.
+        """
+        if self.rollout is not None:
+            return self.rollout(c.state, c.node_level)
+        return playout(c.state, c.node_level, verbose=verbose)
 
     def backpropagation(self, c, winner):
         """ Backpropagate the result of the playout up the path to the root node R. """
-        c.inc_simulations(winner)
+        path = self.path
+        if not path or path[-1] is not c:
+            # C was not reached through the last selection, follow the parent nodes instead.
+            c.inc_simulations(winner)
+            return
+        self.backpropagate_path(path, winner)
+
+    def backpropagate_path(self, path, winner):
+        """ Backpropagate the winner (or score from 0 to 1) of the last node of path up to the first node of path. """
+        # With a transposition table, a node may be shared by several parents. Hence, follow the path of the selection.
+        for node in reversed(path):
+            node.add_result(winner)
+            winner = 1 - winner
+
+    def backpropagate_paths(self, paths, winners):
+        """ Backpropagate a batch of results (the winner or score of the last node of each path) in one pass.
+            The results are summed per node first, so nodes shared by several paths (e.g., the root) are updated only once.
+        """
+        results = {}
+        for path, winner in zip(paths, winners):
+            for node in reversed(path):
+                result = results.get(id(node))
+                if result is None:
+                    result = results[id(node)] = [node, 0, 0]
+                result[1] += winner
+                result[2] += 1
+                winner = 1 - winner
+        for node, wins, simulations in results.values():
+            node.add_results(wins, simulations)
+
+    def add_virtual_loss(self, path, n=VIRTUAL_LOSS):
+        """ Count n pending simulations without wins for all nodes on path (use a negative n to remove them again).
+            This lowers the UCT of the path, so that subsequent selections before the backpropagation spread over the tree.
+        """
+        for node in path:
+            node.simulations += n
+
+    def select_and_expand(self, n_children, stats=None):
+        """ Selection and expansion. Returns the node C to simulate from, self.path ends with C.
+            With stats, the time of both phases and the depth of C are added to stats.
+        """
+        if stats is not None:
+            t0 = time.perf_counter()
+        l = self.selection()
+        if stats is not None:
+            t1 = time.perf_counter()
+        c = self.expansion(l, n_children=n_children)
+
+        # When l was a final state already, expansion returns None.
+        # In this case we only run another "simulation" starting from l (which just returns the winner of l).
+        # Altogether, the result is another backpropagation of the winner in l.
+        if c is None:
+            c = l
+        else:
+            self.path.append(c)
+        if stats is not None:
+            stats.seconds["selection"] += t1 - t0
+            stats.seconds["expansion"] += time.perf_counter() - t1
+            stats.max_depth = max(stats.max_depth, len(self.path) - 1)
+        return c
+
+    def step(self, n_children, stats=None):
+        """ One iteration of the search: selection, expansion, simulation and backpropagation.
+            With stats, the timings of the phases and the counters of the simulation are added to stats.
+        """
+        c = self.select_and_expand(n_children, stats)
+        if stats is None:
+            self.backpropagation(c, self.simulation(c))
+            return
+        t0 = time.perf_counter()
+        if self.rollout is not None:
+            winner = self.rollout(c.state, c.node_level)
+            stats.rollout_plies += getattr(self.rollout, "last_plies", 0)
+            stats.state_copies += 1
+        else:
+            winner, plies = counted_playout(c.state, c.node_level)
+            stats.rollout_plies += plies
+            # The random playout creates a new state per ply.
+            stats.state_copies += plies
+        stats.rollouts += 1
+        t1 = time.perf_counter()
+        self.backpropagation(c, winner)
+        stats.seconds["simulation"] += t1 - t0
+        stats.seconds["backpropagation"] += time.perf_counter() - t1
+
+    def run_batch(self, n_leaves, n_children, executor, stats=None):
+        """ Leaf parallelization: selects n_leaves nodes, simulates from them in the executor and backpropagates all results.
+            With an evaluator, the selected nodes are evaluated in one batch instead (executor is not used).
+            A virtual loss is applied to the path of every selected node until its result is backpropagated.
+        """
+        paths = []
+        for k in range(n_leaves):
+            self.select_and_expand(n_children, stats)
+            self.add_virtual_loss(self.path)
+            paths.append(self.path)
+        states = [path[-1].state for path in paths]
+        levels = [path[-1].node_level for path in paths]
+        t = time.perf_counter()
+        if self.evaluator is not None:
+            winners = self.evaluator(states, levels)
+        else:
+            winners = list(executor.map(self.rollout or playout, states, levels))
+        if stats is not None:
+            stats.seconds["simulation"] += time.perf_counter() - t
+            t = time.perf_counter()
+        for path in paths:
+            self.add_virtual_loss(path, -VIRTUAL_LOSS)
+        self.backpropagate_paths(paths, winners)
+        if stats is not None:
+            stats.seconds["backpropagation"] += time.perf_counter() - t
 
-    def run(self, n_simulations=1000, verbose=True, print_every=50, n_children=100):
-        """ Runs the full Monte Carlo tree search. 
-            n_simulations: The number of simulations to run.
-            verbose: Whether to print stats (number of simulations).
-            print_every: After how many simulations to print the current status.
+    def run(self, n_simulations=1000, verbose=True, print_every=50, n_children=100, n_leaves=1, executor=None,
+            time_budget_ms=None, max_nodes=None, max_memory_mb=None, stats=None, log_every=None, stop=None):
+        """ Runs the full Monte Carlo tree search until the first of the given limits is reached and returns a SearchResult.
+            n_simulations: The number of simulations to run (None for no limit).
+            verbose: Whether to print the progress (number of simulations).
+            print_every: After how many simulations to print the progress.
             n_children: how many child nodes to expand from a node at most.
+            n_leaves: With more than one leaf, the simulations of n_leaves selected nodes are run in parallel (see run_batch).
+                With an evaluator, n_leaves selected nodes are evaluated per batch (use tens of leaves, a batch of one is not faster).
+            executor: A concurrent.futures executor for the parallel simulations. By default, a process pool is created for this run.
+                The game states are sent to the workers, so they must be picklable.
+            time_budget_ms: Stop after this many milliseconds.
+            max_nodes: Stop when this many nodes have been added to the tree in this run.
+            max_memory_mb: Stop when the process uses this much memory (checked every MEMORY_CHECK_EVERY simulations).
+            stats: A SearchStats to collect timings and counters into (or True for a new one). Without stats, nothing is measured.
+            log_every: With stats, log them as JSON to the logger chess.mcts at level INFO after every log_every simulations.
+            stop: An object with a method is_set() (e.g., a threading.Event), checked before every simulation. Once it is set, the search stops.
         """
-        for i in range(n_simulations):
-            l = self.selection()
-            c = self.expansion(l, n_children=n_children)
-            
-            # When l was a final state already, expansion returns None.
-            # In this case we only run another "simulation" starting from l (which just returns the winner of l).
-            # Altogether, the result is another backpropagation of the winner in l.
-            if c is None:
-                c = l
-            winner = self.simulation(c, verbose=False)
-            self.backpropagation(c, winner)
-            if verbose and i%print_every == 0:
+        if n_simulations is None and time_budget_ms is None and max_nodes is None and max_memory_mb is None:
+            raise ValueError("The search needs at least one limit.")
+        if stats is True:
+            stats = SearchStats()
+        if self.book is not None:
+            move = self.book.best_move(self.node.state.key())
+            if move is not None:
+                return SearchResult(0, 0, 0.0, move, "book", stats)
+        if n_leaves > 1 and executor is None and self.evaluator is None:
+            with ProcessPoolExecutor() as executor:
+                return self.run(n_simulations, verbose, print_every, n_children, n_leaves, executor, time_budget_ms, max_nodes, max_memory_mb, stats, log_every, stop)
+
+        start = time.perf_counter()
+        deadline = None if time_budget_ms is None else start + time_budget_ms / 1000
+        n_nodes = self.n_nodes
+        max_n_nodes = None if max_nodes is None else n_nodes + max_nodes
+        # Counters at the last update of the stats.
+        counted = (0, self.n_nodes, self.n_states, start)
+        next_memory_check = 0
+        budget = self.max_tree_nodes is not None or self.max_tree_bytes is not None
+        stop_reason = "simulations"
+        i = 0
+        while n_simulations is None or i < n_simulations:
+            # Check the limits. Reading the clock is cheap compared to a simulation, the memory is checked less often.
+            if deadline is not None and time.perf_counter() >= deadline:
+                stop_reason = "time"
+                break
+            if stop is not None and stop.is_set():
+                stop_reason = "stopped"
+                break
+            if max_n_nodes is not None and self.n_nodes >= max_n_nodes:
+                stop_reason = "nodes"
+                break
+            if max_memory_mb is not None and i >= next_memory_check:
+                if memory_mb() >= max_memory_mb:
+                    stop_reason = "memory"
+                    break
+                next_memory_check = i + MEMORY_CHECK_EVERY
+            if budget and self.over_budget():
+                self.enforce_budget()
+
+            if n_leaves > 1 or self.evaluator is not None:
+                batch = n_leaves if n_simulations is None else min(n_leaves, n_simulations - i)
+                self.run_batch(batch, n_children, executor, stats)
+            else:
+                batch = 1
+                self.step(n_children, stats)
+            if verbose and (i + batch - 1)//print_every > (i - 1)//print_every:
                 print(f"{i} simulations run.")
+            i += batch
+            if log_every is not None and stats is not None and i//log_every > (i - batch)//log_every:
+                counted = self.update_stats(stats, i, counted)
+                logger.info("MCTS stats: %s", json.dumps(stats.as_dict()))
+
+        best_child = self.node.best_child()
+        if stats is not None:
+            self.update_stats(stats, i, counted)
+        return SearchResult(i, self.n_nodes - n_nodes, time.perf_counter() - start, None if best_child is None else best_child.move, stop_reason, stats)
+
+    def update_stats(self, stats, i, counted):
+        """ Adds the simulations, nodes, states and time since the counters counted (as returned by the last update) to stats.
+            i is the number of simulations run. Returns the current counters.
+        """
+        iterations, n_nodes, n_states, start = counted
+        now = time.perf_counter()
+        stats.iterations += i - iterations
+        stats.nodes += self.n_nodes - n_nodes
+        stats.state_copies += self.n_states - n_states
+        stats.elapsed += now - start
+        return i, self.n_nodes, self.n_states, now
 
     def best_moves(self):
         return self.node.rank_child_nodes()
 
+    def tree_bytes(self):
+        """ Estimated memory of the tree below the current node. """
+        return self.tree_nodes * NODE_BYTES + self.tree_states * STATE_BYTES
+
+    def over_budget(self, fraction=1):
+        """ Whether the tree, apart from the budget_excess, exceeds fraction of its budget. """
+        excess_nodes, excess_bytes = self.budget_excess
+        if self.max_tree_nodes is not None and self.tree_nodes - excess_nodes > fraction * self.max_tree_nodes:
+            return True
+        return self.max_tree_bytes is not None and self.tree_bytes() - excess_bytes > fraction * self.max_tree_bytes
+
+    def subtree(self):
+        """ The nodes below the current node in breadth-first order (shared nodes once). """
+        nodes = [self.node]
+        seen = {id(self.node)}
+        for node in nodes:
+            for c in node.children:
+                if id(c) not in seen:
+                    seen.add(id(c))
+                    nodes.append(c)
+        return nodes
+
+    def count_tree(self):
+        """ Recounts the nodes and states below the current node. Returns the nodes in breadth-first order. """
+        nodes = self.subtree()
+        self.tree_nodes = len(nodes)
+        self.tree_states = sum(1 for node in nodes if node.has_state())
+        return nodes
+
+    def enforce_budget(self):
+        """ Reduces the tree below the current node to EVICTION_TARGET of its budget.
+            First, the states of interior nodes are dropped. Then, the subtrees of the least simulated interior nodes are evicted: the nodes keep their
+            statistics but lose their child nodes, so they are expanded again when selected. The current node and its child nodes are never evicted,
+            so the statistics of the root stay intact. If they alone exceed the target, the excess is kept in budget_excess.
+        """
+        self.budget_excess = (0, 0)
+        nodes = self.subtree()
+        root = self.node
+        for node in nodes:
+            if node is not root and node.children and node.has_state():
+                node.state = None
+                self.n_dropped_states += 1
+                self.tree_states -= 1
+        if self.over_budget(EVICTION_TARGET):
+            # Subtree sizes (number of nodes and of states below a node), from the leaves up. With a transposition table, shared nodes are
+            # counted once per parent.
+            sizes = {}
+            for node in reversed(nodes):
+                n_nodes = n_states = 0
+                for c in node.children:
+                    c_nodes, c_states = sizes.get(id(c), (0, 0))
+                    n_nodes += c_nodes + 1
+                    n_states += c_states + c.has_state()
+                sizes[id(node)] = [n_nodes, n_states]
+            candidates = [node for node in nodes if node is not root and node.children]
+            candidates.sort(key=lambda node: node.simulations)
+            evicted = set()
+            for node in candidates:
+                if not self.over_budget(EVICTION_TARGET):
+                    break
+                # Skip nodes in an evicted subtree.
+                ancestor = node.parent
+                while ancestor is not None and ancestor is not root and id(ancestor) not in evicted:
+                    ancestor = ancestor.parent
+                if ancestor is not None and ancestor is not root:
+                    continue
+                evicted.add(id(node))
+                n_nodes, n_states = sizes[id(node)]
+                self.tree_nodes -= n_nodes
+                self.tree_states -= n_states
+                self.n_evicted += n_nodes
+                node.children = NO_CHILDREN
+                node.untried = None
+                # The subtrees of the ancestors shrink as well (an ancestor may be evicted later).
+                ancestor = node.parent
+                while ancestor is not None and ancestor is not root:
+                    size = sizes.get(id(ancestor))
+                    if size is not None:
+                        size[0] -= n_nodes
+                        size[1] -= n_states
+                    ancestor = ancestor.parent
+            if self.transposition_table is not None:
+                # Shared nodes were subtracted once per parent.
+                self.count_tree()
+        excess_nodes = 0 if self.max_tree_nodes is None else max(0, self.tree_nodes - EVICTION_TARGET * self.max_tree_nodes)
+        excess_bytes = 0 if self.max_tree_bytes is None else max(0, self.tree_bytes() - EVICTION_TARGET * self.max_tree_bytes)
+        self.budget_excess = (excess_nodes, excess_bytes)
+        if self.transposition_table is not None:
+            self.transposition_table.rebuild(root)
+
+    def save(self, path):
+        """ Saves the statistics of the full tree to a compact binary file (see treefile). No game states are saved. """
+        from . import treefile
+        treefile.save(self.tree, path)
+
+    @classmethod
+    def load(cls, path, state, **kwargs):
+        """ Creates an MCTS continuing the search of a tree saved with save. state is the game state of the saved root node.
+            The other arguments are passed to MCTS.
+        """
+        from . import treefile
+        mcts = cls(state, **kwargs)
+        mcts.tree = mcts.node = treefile.load(path).to_node(state)
+        if mcts.max_tree_nodes is not None or mcts.max_tree_bytes is not None:
+            mcts.count_tree()
+        return mcts
+
+    def advance(self, move):
+        """ Makes the child node of the move the current node and root of the tree, e.g., after the move has been played.
+            The statistics of the child's subtree are kept for the following searches. The child is expanded if it is missing.
+            The rest of the tree is detached, so its memory can be freed. Raises ValueError if the move is not possible.
+        """
+        node = self.node
+        child = None
+        for c in node.children:
+            if c.move == move:
+                child = c
+                break
+        if child is None:
+            if move not in node.state.moves():
+                raise ValueError(f"Move {move} is not possible.")
+            child = Node(None, move=move)
+            node.add_child(child)
+            self.n_nodes += 1
+        # The child keeps its node level, since the level determines the player of winner(i).
+        child.materialize()
+        child.detach()
+        node.children = NO_CHILDREN
+        self.tree = child
+        self.node = child
+        self.path = []
+        if self.transposition_table is not None:
+            # Child lists are shared, so a child node in the kept subtree may have a discarded node as parent, which would keep the
+            # discarded nodes reachable. Such child nodes get the kept node listing them as parent (same list, so the index stays valid).
+            nodes = self.subtree()
+            kept = {id(n) for n in nodes}
+            for n in nodes:
+                for c in n.children:
+                    if id(c.parent) not in kept:
+                        c.parent = n
+            self.transposition_table.rebuild(child)
+        if self.max_tree_nodes is not None or self.max_tree_bytes is not None:
+            self.count_tree()
+            self.budget_excess = (0, 0)
+        return child
+
+class ChildList(list):
+    """ The child nodes of a node.
+        The statistics of the child nodes are stored in NumPy arrays (indexed like the list), so the UCT of all children is computed at once.
+    """
+    __slots__ = ("wins", "simulations")
+
+    def __init__(self):
+        super().__init__()
+        self.wins = np.zeros(0)
+        self.simulations = np.zeros(0, dtype=np.int64)
+
+    def reserve(self, capacity):
+        """ Make room in the arrays for capacity child nodes. """
+        if capacity > len(self.wins):
+            wins = np.zeros(capacity)
+            simulations = np.zeros(capacity, dtype=np.int64)
+            wins[:len(self)] = self.wins[:len(self)]
+            simulations[:len(self)] = self.simulations[:len(self)]
+            self.wins = wins
+            self.simulations = simulations
+
+    def add(self, node, wins, simulations):
+        index = len(self)
+        if index == len(self.wins):
+            self.reserve(max(4, 2 * index))
+        self.wins[index] = wins
+        self.simulations[index] = simulations
+        node.index = index
+        self.append(node)
+
+    def best_uct(self, parent_simulations):
+        """ Index of the child with the highest UCT (see Node.get_uct). Ties are broken randomly. """
+        n = len(self)
+        wins = self.wins[:n]
+        simulations = self.simulations[:n]
+        # A parent sharing its child nodes through a transposition table can have fewer simulations than its children.
+        log_parent = math.log(max(parent_simulations, 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            uct = wins/simulations + UCT_C*np.sqrt(log_parent/simulations)
+        uct[simulations == 0] = np.inf
+        best = np.flatnonzero(uct == uct.max())
+        if len(best) == 1:
+            return best[0]
+        return best[random.randrange(len(best))]
+
+# The child list of every node without child nodes. It is shared, so leaves do not hold arrays of their own (see Node.child_list).
+NO_CHILDREN = ChildList()
+
+def python_wins(wins):
+    """ A number of wins as a Python int if it is whole (simulations with a winner), else as a float (simulations with scores). """
+    wins = float(wins)
+    return int(wins) if wins.is_integer() else wins
+
 class Node:
     """ A node of the tree.
         A node holds a game state, the move that led to this state, 
         the number of wins of the active player, the number of simulations run, the child nodes and the parent node.
+        The wins and simulations of a child node are stored in the ChildList of its parent.
     """
+    __slots__ = ("_state", "node_level", "move", "children", "untried", "parent", "index", "_wins", "_simulations")
+
     def __init__(self, state, move=None, copystate=False):
         from copy import deepcopy
         if copystate:
             state = deepcopy(state)
-        self.state = state
+        # The game state. If it is None, it is created from the state of the parent node and the move when needed.
+        self._state = state
         self.node_level = 0
         self.move = move
-        self.wins = 0
-        self.simulations = 0
-        self.children = []
+        self.children = NO_CHILDREN
+        # Moves without child nodes yet (None if there are none).
+        self.untried = None
         self.parent = None
+        # Index in the child list of the parent.
+        self.index = None
+        # Statistics of a node without parent.
+        self._wins = 0
+        self._simulations = 0
+
+    @property
+    def state(self):
+        if self._state is None and self.parent is not None:
+            # Replay the moves from the closest ancestor holding a state.
+            nodes = [self]
+            node = self.parent
+            while node._state is None and node.parent is not None:
+                nodes.append(node)
+                node = node.parent
+            state = node._state
+            for node in reversed(nodes):
+                state = state.successor(node.move)
+            self._state = state
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self._state = state
+
+    def materialize(self):
+        """ Creates the state of the node (from the closest ancestor holding a state) unless it has one, and returns it. """
+        return self.state
+
+    def has_state(self):
+        return self._state is not None
+
+    @property
+    def wins(self):
+        if self.parent is None:
+            return python_wins(self._wins)
+        return python_wins(self.parent.children.wins[self.index])
+
+    @wins.setter
+    def wins(self, wins):
+        if self.parent is None:
+            self._wins = wins
+        else:
+            self.parent.children.wins[self.index] = wins
+
+    @property
+    def simulations(self):
+        if self.parent is None:
+            return self._simulations
+        return int(self.parent.children.simulations[self.index])
+
+    @simulations.setter
+    def simulations(self, simulations):
+        if self.parent is None:
+            self._simulations = simulations
+        else:
+            self.parent.children.simulations[self.index] = simulations
+
+    def child_list(self):
+        """ The ChildList of the node to add child nodes to. A node without child nodes gets its own one here (instead of NO_CHILDREN). """
+        if self.children is NO_CHILDREN:
+            self.children = ChildList()
+        return self.children
 
     def add_child(self, node):
-        self.children.append(node)
+        wins, simulations = node.wins, node.simulations
         node.parent = self
+        self.child_list().add(node, wins, simulations)
         node.node_level = self.node_level + 1
 
-    def inc_simulations(self, win):
+    def detach(self):
+        """ Removes the link to the parent node (e.g., when the node becomes the root). The statistics move to the node itself. """
+        if self.parent is not None:
+            wins, simulations = self.wins, self.simulations
+            self.parent = None
+            self.index = None
+            self._wins = wins
+            self._simulations = simulations
+
+    def add_result(self, win):
+        """ Count a simulation of this node only (without backpropagation). win is a bool or a score from 0 (loss) to 1 (win). """
         self.simulations += 1
-        if win:
-            self.wins += 1
+        self.wins += win
 
-        # Backpropagate simulations up the tree.
+    def add_results(self, wins, simulations):
+        """ Count a number of simulations with a number of wins for this node only (without backpropagation). """
+        self.simulations += simulations
+        self.wins += wins
+
+    def inc_simulations(self, win):
+        # Backpropagate simulations up the tree (iteratively, deep trees would exceed the recursion limit).
         # In the parent node, the other player is active. Hence, a win in the current node is a loss in the parent node.
-        if self.parent is not None:
-            self.parent.inc_simulations(not win)
+        node = self
+        while node is not None:
+            node.add_result(win)
+            win = 1 - win
+            node = node.parent
 
-    def get_uct(self):
-        if self.parent is None:
+    def get_uct(self, parent=None):
+        """ Upper confidence bound of the node as a child of parent (by default its parent node). """
+        if parent is None:
+            parent = self.parent
+        if parent is None:
             raise Exception("Calculation of uct is not valid for a root node.")
-        import math
         if self.simulations == 0:
             return float("inf")
         exploitation = self.wins/self.simulations 
-        c = math.sqrt(2)
-        exploration = c*math.sqrt(math.log(self.parent.simulations)/self.simulations)
+        # A parent sharing its child nodes through a transposition table can have fewer simulations than its children.
+        exploration = UCT_C*math.sqrt(math.log(max(parent.simulations, 1))/self.simulations)
         return exploration + exploitation
     
     def has_children(self):
@@ -163,3 +811,111 @@ class Node:
         result += "Node level: " + str(self.node_level) + "\n"
         result += "Wins: " + str(self.wins) + "/" + str(self.simulations)
         return result
+
+class TranspositionTable:
+    """ Bounded map from game states (key and node level) to the first node created for them.
+        When the table is full, the least recently used entry is evicted. Evicted nodes stay in the tree, they are just not shared anymore.
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def share(self, node):
+        """ Let node share state and child nodes with an earlier node of the same game state, or register it as the first one.
+            The node level is part of the key, so a node never shares the child nodes of one of its ancestors.
+        """
+        key = (node.state.key(), node.node_level)
+        other = self.entries.get(key)
+        if other is None:
+            self.entries[key] = node
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return False
+        self.entries.move_to_end(key)
+        node.state = other.state
+        # The child list is shared, so child nodes added to one node are child nodes of the other as well.
+        node.children = other.child_list()
+        return True
+
+    def rebuild(self, root):
+        """ Replaces the entries by the nodes of the tree below root (e.g., when the root moved), so that no discarded nodes are kept. """
+        self.entries.clear()
+        nodes = [root]
+        while nodes and len(self.entries) < self.max_size:
+            node = nodes.pop()
+            if not node.has_state():
+                continue
+            key = (node.state.key(), node.node_level)
+            if key not in self.entries:
+                self.entries[key] = node
+                nodes.extend(node.children)
+
+    def __len__(self):
+        return len(self.entries)
+
+def search_root(state, n_simulations, seed, run_args, node_level=0):
+    """ Runs an MCTS from state with the given random seed and returns the statistics of the root's child nodes as a dict move -> (wins, simulations).
+        node_level is the node level of the root (see MCTS). This is the task of a worker process in RootParallelMCTS.
+    """
+    random.seed(seed)
+    mcts = MCTS(state, node_level=node_level)
+    mcts.run(n_simulations=n_simulations, verbose=False, **run_args)
+    return {c.move: (c.wins, c.simulations) for c in mcts.node.children}
+
+class RootParallelMCTS:
+    """ Root parallelization of MCTS.
+        Independent searches from the same root state run in a pool of worker processes, each with its own random seed.
+        The statistics of the root's child nodes are merged by move (pairs of start and target coordinates).
+        The state must be picklable.
+        node_level: Node level of the root (see MCTS). By default, it is the active player of a state holding a Position (1 if black is active),
+            so that the statistics are those of the active player.
+    """
+    def __init__(self, state, n_workers=None, seed=None, node_level=None):
+        import os
+        self.state = state
+        if node_level is None:
+            position = getattr(state, "position", None)
+            node_level = 0 if position is None else position.active
+        self.node_level = node_level
+        self.n_workers = n_workers or os.cpu_count()
+        self.seed = random.randrange(2**32) if seed is None else seed
+        # Number of searches started so far. Every search gets a distinct seed.
+        self.n_searches = 0
+        # Merged statistics of the root's child nodes: move -> [wins, simulations].
+        self.stats = {}
+
+    def run(self, n_simulations=1000, n_children=100, executor=None):
+        """ Runs one search with n_simulations per worker and merges the results.
+            executor: A concurrent.futures executor to use. By default, a process pool with n_workers processes is created for this run.
+        """
+        run_args = {"n_children": n_children}
+        seeds = [self.seed + self.n_searches + i for i in range(self.n_workers)]
+        self.n_searches += self.n_workers
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        try:
+            n = len(seeds)
+            results = list(executor.map(search_root, [self.state] * n, [n_simulations] * n, seeds, [run_args] * n, [self.node_level] * n))
+        finally:
+            if own_executor:
+                executor.shutdown()
+        for result in results:
+            for move, (wins, simulations) in result.items():
+                stats = self.stats.setdefault(move, [0, 0])
+                stats[0] += wins
+                stats[1] += simulations
+
+    def best_moves(self):
+        """ Child nodes of the root holding the merged statistics, ranked like MCTS.best_moves. """
+        root = Node(self.state)
+        root.node_level = self.node_level
+        root.wins = sum(stats[1] - stats[0] for stats in self.stats.values())
+        root.simulations = sum(stats[1] for stats in self.stats.values())
+        # The states of the child nodes are created from the moves when needed.
+        for move in self.state.moves():
+            if move in self.stats:
+                c = Node(None, move=move)
+                c.wins, c.simulations = self.stats[move]
+                root.add_child(c)
+        return root.rank_child_nodes()
@@ -0,0 +1,158 @@
+# A compact representation of a game situation.
+# The board is a bytearray of 64 piece codes indexed by square = y*8 + x, i.e., square 0 is A1, square 7 is H1 and square 63 is H8.
+# Moves are applied in place with make_move and reverted with unmake_move, so no object graph has to be copied per move.
+# The move rules are the same as in the object model of chess.py (Piece.can_move_to).
+from .tables import square, coordinates, ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS, KNIGHT_STEPS, KING_STEPS
+from .zobrist import hash_board, move_keys
+
+WHITE = 0
+BLACK = 1
+
+# Piece codes. White pieces are 1-6, black pieces are 7-12 (the white code + BLACK_OFFSET). 0 is an empty square.
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+BLACK_OFFSET = 6
+
+# Color of a piece code (None for an empty square).
+COLOR = (None,) + (WHITE,) * 6 + (BLACK,) * 6
+# Piece type (PAWN, ..., KING) of a piece code.
+KIND = (EMPTY,) + tuple(range(1, 7)) * 2
+
+def piece_code(kind, color):
+    return kind + BLACK_OFFSET * color
+
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+
+def initial_board():
+    board = bytearray(64)
+    for color, back_row, pawn_row in ((WHITE, 0, 1), (BLACK, 7, 6)):
+        for x, kind in enumerate((ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)):
+            board[square(x, back_row)] = piece_code(kind, color)
+            board[square(x, pawn_row)] = piece_code(PAWN, color)
+    return board
+
+class Position:
+    """ A game situation: the board, the active player (WHITE or BLACK) and the winner (None while the game is running).
+        The game is won by beating the enemy king. The Zobrist hash of board and active player is kept up to date in make_move.
+    """
+    __slots__ = ("board", "active", "winner", "hash", "history")
+
+    def __init__(self, board=None, active=WHITE, winner=None):
+        self.board = initial_board() if board is None else bytearray(board)
+        self.active = active
+        self.winner = winner
+        self.hash = hash_board(self.board, active)
+        # Undo stack of (start, target, beaten piece code, previous winner).
+        self.history = []
+
+    def copy(self):
+        """ Copy of the position without the undo stack. """
+        position = Position.__new__(Position)
+        position.board = bytearray(self.board)
+        position.active = self.active
+        position.winner = self.winner
+        position.hash = self.hash
+        position.history = []
+        return position
+
+    def load(self, board, active, winner=None):
+        """ Replaces the game situation in place by the given one (e.g., to reuse the position when loading many positions). """
+        if board is not self.board:
+            self.board[:] = board
+        self.active = active
+        self.winner = winner
+        self.hash = hash_board(self.board, active)
+        self.history.clear()
+
+    def is_final(self):
+        return self.winner is not None
+
+    def moves(self):
+        """ Returns all possible moves of the active player as a list of (start, target) squares. """
+        board = self.board
+        active = self.active
+        moves = []
+        for start in range(64):
+            code = board[start]
+            if code == EMPTY or COLOR[code] != active:
+                continue
+            kind = KIND[code]
+            if kind == PAWN:
+                self.pawn_moves(start, moves)
+            elif kind == KNIGHT or kind == KING:
+                for target in (KNIGHT_STEPS if kind == KNIGHT else KING_STEPS)[start]:
+                    if COLOR[board[target]] != active:
+                        moves.append((start, target))
+            else:
+                for ray in SLIDER_RAYS[kind][start]:
+                    for target in ray:
+                        target_code = board[target]
+                        if target_code == EMPTY:
+                            moves.append((start, target))
+                            continue
+                        if COLOR[target_code] != active:
+                            moves.append((start, target))
+                        break
+        return moves
+
+    def pawn_moves(self, start, moves):
+        board = self.board
+        active = self.active
+        x, y = coordinates(start)
+        direction = 8 if active == WHITE else -8
+        if not 0 <= y + (1 if active == WHITE else -1) < 8:
+            return
+        forward = start + direction
+        # Beating a piece diagonally.
+        if x > 0 and board[forward - 1] != EMPTY and COLOR[board[forward - 1]] != active:
+            moves.append((start, forward - 1))
+        if x < 7 and board[forward + 1] != EMPTY and COLOR[board[forward + 1]] != active:
+            moves.append((start, forward + 1))
+        # Moving one square forward.
+        if board[forward] == EMPTY:
+            moves.append((start, forward))
+            # Initial movement of two squares. As in Pawn.can_move_to, the target may hold an enemy piece.
+            if y == (1 if active == WHITE else 6) and COLOR[board[forward + direction]] != active:
+                moves.append((start, forward + direction))
+
+    def make_move(self, start, target):
+        """ Moves the piece on start to target without checking the move. Beating the enemy king wins the game. """
+        board = self.board
+        beaten = board[target]
+        self.history.append((start, target, beaten, self.winner))
+        code = board[start]
+        self.hash ^= move_keys(code, start, target, beaten)
+        board[target] = code
+        board[start] = EMPTY
+        if KIND[beaten] == KING:
+            self.winner = self.active
+        self.active ^= 1
+
+    def unmake_move(self):
+        """ Reverts the last move done with make_move. """
+        start, target, beaten, winner = self.history.pop()
+        board = self.board
+        code = board[target]
+        self.hash ^= move_keys(code, start, target, beaten)
+        board[start] = code
+        board[target] = beaten
+        self.winner = winner
+        self.active ^= 1
+
+    def __eq__(self, other):
+        # A BitboardPosition compares equal to a Position of the same game situation (see BitboardPosition.__eq__).
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self.board == other.board and self.active == other.active and self.winner == other.winner
+
+    def __hash__(self):
+        # Equal positions have equal Zobrist hashes. The hash changes with every move, so a position must not be moved while in a set or dict.
+        return self.hash
+
+    def __repr__(self):
+        return "Position(" + repr(bytes(self.board)) + ", active=" + str(self.active) + ", winner=" + str(self.winner) + ")"
@@ -0,0 +1,67 @@
+# Fast playouts (rollouts) for MCTS.
+# A rollout plays a game in place on one copy of the Position of a state, so no state is copied per ply.
+# The moves are chosen by a policy: a function policy(position, moves) returning one of the moves ((start, target) squares).
+import random
+
+from .position import KIND, COLOR, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+# Material values of the piece types. The king ends the game when beaten, so a policy values beating it highest.
+MATERIAL = {PAWN: 1, KNIGHT: 3, BISHOP: 3, ROOK: 5, QUEEN: 9, KING: 100}
+# Material value by piece code.
+PIECE_VALUES = tuple(MATERIAL.get(kind, 0) for kind in KIND)
+
+def random_policy(position, moves):
+    """ Chooses a move uniformly at random. """
+    return random.choice(moves)
+
+def capture_first_policy(position, moves):
+    """ Chooses a random move beating a piece if there is one, otherwise a random move. """
+    board = position.board
+    captures = [move for move in moves if board[move[1]]]
+    return random.choice(captures or moves)
+
+def material_policy(position, moves):
+    """ Chooses a random move, weighted by 1 + the material value of the beaten piece. """
+    board = position.board
+    weights = [1 + PIECE_VALUES[board[target]] for start, target in moves]
+    return random.choices(moves, weights)[0]
+
+def material_balance(board):
+    """ Material of white minus material of black (kings not counted). """
+    balance = 0
+    for code in board:
+        if code and KIND[code] != KING:
+            balance += PIECE_VALUES[code] if COLOR[code] == WHITE else -PIECE_VALUES[code]
+    return balance
+
+class Rollout:
+    """ Plays out games with a policy, up to an optional maximum number of plies.
+        When a game is cut off, the player with more material is the winner (a tie is decided randomly).
+        A Rollout can be passed to MCTS (rollout=...) to replace the random simulation. It is picklable if its policy is a module level function.
+    """
+    def __init__(self, policy=random_policy, max_plies=None):
+        self.policy = policy
+        self.max_plies = max_plies
+        # Number of plies of the last game played by __call__.
+        self.last_plies = 0
+
+    def play(self, position):
+        """ Plays out the game in place on position. Returns the winner (WHITE or BLACK) and the number of plies played. """
+        policy = self.policy
+        max_plies = self.max_plies
+        plies = 0
+        while position.winner is None:
+            if max_plies is not None and plies >= max_plies:
+                balance = material_balance(position.board)
+                if balance == 0:
+                    return random.randrange(2), plies
+                return (WHITE if balance > 0 else BLACK), plies
+            start, target = policy(position, position.moves())
+            position.make_move(start, target)
+            plies += 1
+        return position.winner, plies
+
+    def __call__(self, state, i):
+        """ Simulates from a game state (holding a Position) and returns whether the player of node level i has won (see GameControllerAdapter.winner). """
+        winner, self.last_plies = self.play(state.position.copy())
+        return winner == (i+1)%2
@@ -0,0 +1,165 @@
+# Self-play data generation.
+# Games are played in a pool of worker processes, either with random moves or with an MCTS per ply, and streamed to sharded JSON lines files
+# (games-00000.jsonl, ...) in a directory. Every line is one finished game:
+#     {"game": index, "moves": [[xs, ys, xt, yt], ...], "winner": 0}
+# with the moves as start and target coordinates (as in GameController.move) and the winner as color (0 white, 1 black, null for a game
+# cut off at max_plies). Game i is played with the random seed seed + i, so a restarted run skips the games already in the shards and
+# produces the same set of games.
+# Run with: python -m chess.selfplay --games 10000 --output games/
+import argparse
+import json
+import os
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .chess import GameController
+from .chess_adapter import GameControllerAdapter
+from .mcts import MCTS
+from .position import coordinates
+
+def random_game(max_plies=None):
+    """ Plays a game with random moves. Returns the moves as (start, target) coordinates and the winner (None if cut off). """
+    position = GameController().get_position()
+    moves = []
+    while position.winner is None and (max_plies is None or len(moves) < max_plies):
+        start, target = random.choice(position.moves())
+        position.make_move(start, target)
+        moves.append((coordinates(start), coordinates(target)))
+    return moves, position.winner
+
+def mcts_game(n_simulations, n_children, max_plies=None):
+    """ Plays a game with an MCTS of n_simulations per ply. The tree below the played move is kept for the next ply. """
+    mcts = MCTS(GameControllerAdapter(GameController()))
+    moves = []
+    while not mcts.node.state.is_final() and (max_plies is None or len(moves) < max_plies):
+        move = mcts.run(n_simulations, verbose=False, n_children=n_children).best_move
+        mcts.advance(move)
+        moves.append(move)
+    return moves, mcts.node.state.position.winner
+
+def play_game(index, seed, policy, n_simulations, n_children, max_plies):
+    """ Plays game number index with the random seed seed + index and returns it as a record. Runs in the worker processes. """
+    random.seed(seed + index)
+    if policy == "random":
+        moves, winner = random_game(max_plies)
+    else:
+        moves, winner = mcts_game(n_simulations, n_children, max_plies)
+    return {"game": index, "moves": [[xs, ys, xt, yt] for (xs, ys), (xt, yt) in moves], "winner": winner}
+
+def shard_path(directory, shard):
+    return os.path.join(directory, f"games-{shard:05d}.jsonl")
+
+def read_games(directory):
+    """ Yields the games stored in the shards of a directory. """
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("games-") and name.endswith(".jsonl"):
+            with open(os.path.join(directory, name)) as f:
+                for line in f:
+                    yield json.loads(line)
+
+class SelfPlay:
+    """ Plays n_games games and writes them to shards of shard_size games in directory.
+        policy: "random" or "mcts" (with n_simulations and n_children per ply).
+        max_plies: Optional maximum length of a game.
+        seed: Game i is played with the random seed seed + i.
+        n_workers: Number of worker processes (by default the number of CPUs).
+        max_pending: Maximum number of games submitted to the workers but not written yet (by default 4 per worker). Bounds the memory.
+    """
+    def __init__(self, directory, n_games, policy="random", n_simulations=100, n_children=20, max_plies=None, shard_size=1000,
+                 seed=0, n_workers=None, max_pending=None):
+        if policy not in ("random", "mcts"):
+            raise ValueError("Unknown policy: " + str(policy))
+        self.directory = directory
+        self.n_games = n_games
+        self.policy = policy
+        self.n_simulations = n_simulations
+        self.n_children = n_children
+        self.max_plies = max_plies
+        self.shard_size = shard_size
+        self.seed = seed
+        self.n_workers = n_workers or os.cpu_count()
+        self.max_pending = max_pending or 4 * self.n_workers
+
+    def completed(self):
+        """ Indices of the games already written. A partly written last line (e.g., after a crash) is removed from its shard. """
+        completed = set()
+        if not os.path.isdir(self.directory):
+            return completed
+        for shard in range((self.n_games + self.shard_size - 1) // self.shard_size):
+            path = shard_path(self.directory, shard)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb+") as f:
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    f.truncate(end)
+            for line in data[:end].splitlines():
+                completed.add(json.loads(line)["game"])
+        return completed
+
+    def run(self, executor=None):
+        """ Plays the games not written yet and yields every game (as a dict) after it has been written.
+            executor: A concurrent.futures executor to use. By default, a process pool with n_workers processes is created.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        completed = self.completed()
+        indices = (i for i in range(self.n_games) if i not in completed)
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        args = (self.seed, self.policy, self.n_simulations, self.n_children, self.max_plies)
+        pending = deque()
+        shard = None
+        f = None
+        try:
+            while True:
+                # Keep at most max_pending games in flight, the results are written in the order of the games.
+                for index in indices:
+                    pending.append(executor.submit(play_game, index, *args))
+                    if len(pending) >= self.max_pending:
+                        break
+                if not pending:
+                    break
+                game = pending.popleft().result()
+                if game["game"] // self.shard_size != shard:
+                    if f is not None:
+                        f.close()
+                    shard = game["game"] // self.shard_size
+                    f = open(shard_path(self.directory, shard), "a")
+                f.write(json.dumps(game, separators=(",", ":")) + "\n")
+                f.flush()
+                yield game
+        finally:
+            if f is not None:
+                f.close()
+            for future in pending:
+                future.cancel()
+            if own_executor:
+                executor.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generates self-play games.")
+    parser.add_argument("--games", type=int, default=1000, help="Number of games.")
+    parser.add_argument("--output", required=True, help="Directory of the shards. An interrupted run continues where it stopped.")
+    parser.add_argument("--policy", choices=("random", "mcts"), default="random")
+    parser.add_argument("--simulations", type=int, default=100, help="MCTS simulations per ply.")
+    parser.add_argument("--children", type=int, default=20, help="n_children of the MCTS.")
+    parser.add_argument("--max-plies", type=int, help="Maximum number of plies of a game.")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Number of games per shard.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    args = parser.parse_args(argv)
+
+    selfplay = SelfPlay(args.output, args.games, args.policy, args.simulations, args.children, args.max_plies, args.shard_size,
+                        args.seed, args.workers)
+    n_games = 0
+    for game in selfplay.run():
+        n_games += 1
+    print(f"{n_games} games played, {args.games} games in {args.output}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
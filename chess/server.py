@@ -0,0 +1,320 @@
+# Asyncio service answering best move requests with MCTS.
+# The protocol is JSON lines over TCP, so any line based client (e.g., nc) works. A request is
+#     {"id": 1, "moves": [[xs, ys, xt, yt], ...], "simulations": 1000, "deadline_ms": 500}
+# with the position either as the moves played from the start position, as "encoding" (the text encoding of encoding.py, FEN style)
+# or as "board" (64 piece codes, see position.py, as a hex string) and "active" (0 white, 1 black). Moves cannot be combined with an
+# encoding or a board.
+# simulations and deadline_ms are optional limits of the search.
+# The response is {"id": 1, "move": [xs, ys, xt, yt], "simulations": ..., "stop_reason": ..., "reused": ...} or {"id": 1, "error": "..."}.
+# A running request is cancelled with {"cancel": 1}, which is answered with {"id": 1, "cancelled": true}. Closing the connection cancels
+# all of its requests.
+# Searches run in a pool of worker processes (the search is pure Python and holds the GIL, so threads would share one core). A request
+# is sent to a worker as its Position and moves, and is cancelled through its stop flag in an array shared with the workers: the search
+# stops at the next simulation. Deadlines count from the arrival of a request. A request whose deadline runs out while it waits for a
+# worker still gets a move, from a single simulation (or from the tree of an earlier search).
+# Every worker keeps the trees of the positions it answered in its own TreeCache, so a request for the same position, or for a position a
+# few plies later in the same game, continues the earlier search if it is answered by the same worker.
+# Run with: python -m chess.server --port 8765
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .chess import GameController
+from .chess_adapter import GameControllerAdapter
+from .encoding import decode
+from .mcts import MCTS
+from .position import Position, square
+
+logger = logging.getLogger(__name__)
+
+def parse_position(request):
+    """ The Position of a request, the hashes of the positions after every move and the moves (just the final position and no moves for
+        an encoding or a board). Raises ValueError if a move is not possible.
+    """
+    if ("encoding" in request or "board" in request) and request.get("moves"):
+        raise ValueError("Moves cannot be combined with an encoding or a board.")
+    if "encoding" in request:
+        position = decode(request["encoding"])
+        return position, [position.hash], []
+    if "board" in request:
+        board = bytes.fromhex(request["board"])
+        if len(board) != 64 or max(board) > 12:
+            raise ValueError("A board has 64 piece codes from 0 to 12.")
+        position = Position(board, int(request.get("active", 0)))
+        return position, [position.hash], []
+    position = GameController().get_position()
+    hashes = [position.hash]
+    moves = request.get("moves", [])
+    for move in moves:
+        xs, ys, xt, yt = move
+        start, target = square(xs, ys), square(xt, yt)
+        if position.winner is not None or (start, target) not in position.moves():
+            raise ValueError(f"Move {move} is not possible.")
+        position.make_move(start, target)
+        hashes.append(position.hash)
+    return position, hashes, moves
+
+class TreeCache:
+    """ The MCTS of recently answered positions, by the hash of their current node. When full, the least recently used tree is dropped.
+        A tree is removed from the cache while it is searched, so it is never used by two searches at once.
+    """
+    def __init__(self, max_size=64, reuse_plies=2):
+        self.max_size = max_size
+        # A tree is reused for a position up to this many plies after its current node (the moves are played with MCTS.advance).
+        self.reuse_plies = reuse_plies
+        self.trees = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, hashes, moves):
+        """ Removes and returns the tree of the last position of hashes or of one of the reuse_plies positions before it.
+            moves are the moves leading from position to position (one less than hashes). Returns None if there is no tree.
+        """
+        with self.lock:
+            for j in range(len(hashes) - 1, max(len(hashes) - 2 - self.reuse_plies, -1), -1):
+                mcts = self.trees.pop(hashes[j], None)
+                if mcts is not None:
+                    break
+            else:
+                return None
+        for xs, ys, xt, yt in moves[j:]:
+            mcts.advance(((xs, ys), (xt, yt)))
+        return mcts
+
+    def put(self, mcts):
+        with self.lock:
+            key = mcts.node.state.key()
+            self.trees[key] = mcts
+            self.trees.move_to_end(key)
+            if len(self.trees) > self.max_size:
+                self.trees.popitem(last=False)
+
+    def __len__(self):
+        return len(self.trees)
+
+# State of a worker process, set by init_worker: its TreeCache, the shared stop flags and the opening book.
+worker_cache = None
+worker_flags = None
+worker_book = None
+
+def init_worker(flags, cache_size, book):
+    global worker_cache, worker_flags, worker_book
+    worker_cache = TreeCache(cache_size)
+    worker_flags = flags
+    worker_book = book
+
+class StopFlag:
+    """ The stop flag of a request in the shared flags, with the is_set() of a threading.Event (see MCTS.run). """
+    def __init__(self, flags, slot):
+        self.flags = flags
+        self.slot = slot
+
+    def is_set(self):
+        return self.flags[self.slot] != 0
+
+def search(position, hashes, moves, n_simulations, deadline, n_children, slot):
+    """ Searches the best move of a request in a worker process and returns the response. deadline is a time.time() time (or None).
+        The tree is continued from and put back into the TreeCache of the worker.
+    """
+    mcts = worker_cache.take(hashes, moves)
+    reused = mcts is not None
+    if mcts is None:
+        mcts = MCTS(GameControllerAdapter(position=position), book=worker_book, node_level=position.active)
+    stop = StopFlag(worker_flags, slot)
+    time_budget_ms = None if deadline is None else max(0.0, (deadline - time.time()) * 1000)
+    result = mcts.run(n_simulations, verbose=False, n_children=n_children, time_budget_ms=time_budget_ms, stop=stop)
+    simulations, stop_reason = result.simulations, result.stop_reason
+    if result.best_move is None and stop_reason == "time":
+        # The deadline ran out before the first simulation (e.g., while the request waited for a worker). A single simulation expands
+        # the current node, so there is a move to answer with.
+        result = mcts.run(1, verbose=False, n_children=n_children)
+        simulations += result.simulations
+    worker_cache.put(mcts)
+    if result.best_move is None:
+        if stop.is_set():
+            return None
+        raise ValueError("No move was found.")
+    (xs, ys), (xt, yt) = result.best_move
+    return {"move": [xs, ys, xt, yt], "simulations": simulations, "stop_reason": stop_reason, "reused": reused}
+
+class MoveServer:
+    """ Answers best move requests (see the protocol above).
+        n_workers: Number of worker processes running searches.
+        simulations: Default number of simulations of a search.
+        deadline_ms: Default deadline of a request in milliseconds (None for none).
+        n_children, book: Passed to MCTS.run and MCTS.
+        cache_size: Number of trees in the TreeCache of every worker.
+        max_pending: Maximum number of requests searched or waiting for a worker (more are answered with an error).
+    """
+    def __init__(self, n_workers=None, simulations=1000, deadline_ms=None, n_children=20, cache_size=64, book=None, max_pending=1024):
+        # Stop flags of the pending requests, shared with the workers. Every pending request holds one slot.
+        self.flags = multiprocessing.RawArray("b", max_pending)
+        self.free_slots = list(range(max_pending))
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(max_workers=n_workers or os.cpu_count(), initializer=init_worker, initargs=(self.flags, cache_size, book))
+        self.simulations = simulations
+        self.deadline_ms = deadline_ms
+        self.n_children = n_children
+
+    def acquire_slot(self):
+        with self.lock:
+            if not self.free_slots:
+                raise ValueError("Too many pending requests.")
+            return self.free_slots.pop()
+
+    def release_slot(self, slot):
+        with self.lock:
+            self.flags[slot] = 0
+            self.free_slots.append(slot)
+
+    def stop(self, slot, future):
+        """ Sets the stop flag of a request unless its search has finished (then, the slot may belong to another request already). """
+        with self.lock:
+            if not future.done():
+                self.flags[slot] = 1
+
+    async def best_move(self, request):
+        """ Searches the best move of a request and returns the response. Cancelling the coroutine stops the search. """
+        arrival = time.time()
+        position, hashes, moves = parse_position(request)
+        if position.winner is not None:
+            raise ValueError("The game is finished.")
+        if not position.moves():
+            raise ValueError("No move is possible.")
+        deadline_ms = request.get("deadline_ms", self.deadline_ms)
+        deadline = None if deadline_ms is None else arrival + deadline_ms / 1000
+        n_simulations = request.get("simulations", self.simulations)
+        if n_simulations is None and deadline is None:
+            raise ValueError("A request needs simulations or a deadline.")
+        slot = self.acquire_slot()
+        try:
+            future = self.executor.submit(search, position, hashes, moves, n_simulations, deadline, self.n_children, slot)
+        except BaseException:
+            self.release_slot(slot)
+            raise
+        # The slot is released when the search has finished (or was cancelled before it started).
+        future.add_done_callback(lambda future: self.release_slot(slot))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Cancelling the wrapped future cancels a search still waiting for a worker, a running search is stopped through its flag.
+            self.stop(slot, future)
+            raise
+
+    async def respond(self, request, writer):
+        request_id = request.get("id")
+        try:
+            response = await self.best_move(request)
+        except asyncio.CancelledError:
+            # Confirm the cancellation to the client, then let the task end as cancelled.
+            self.write(writer, {"cancelled": True, "id": request_id})
+            raise
+        except (ValueError, TypeError, KeyError) as e:
+            response = {"error": str(e)}
+        except Exception:
+            logger.exception("Request %r failed.", request)
+            response = {"error": "Internal error."}
+        response["id"] = request_id
+        if self.write(writer, response):
+            await writer.drain()
+
+    def write(self, writer, response):
+        """ Writes a response line unless the connection is closing. Returns whether it was written. """
+        if writer.is_closing():
+            return False
+        writer.write((json.dumps(response) + "\n").encode())
+        return True
+
+    async def handle(self, reader, writer):
+        """ Serves a connection. Requests are answered concurrently, in the order their searches finish. """
+        tasks = {}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    writer.write(b'{"error": "Invalid JSON."}\n')
+                    continue
+                if not isinstance(request, dict):
+                    writer.write(b'{"error": "A request is a JSON object."}\n')
+                    continue
+                if "cancel" in request:
+                    task = tasks.get(request["cancel"])
+                    if task is not None:
+                        task.cancel()
+                    continue
+                task = asyncio.create_task(self.respond(request, writer))
+                tasks[request.get("id")] = task
+                task.add_done_callback(lambda task, request_id=request.get("id"): tasks.pop(request_id, None) if tasks.get(request_id) is task else None)
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """ Starts the TCP server and returns the asyncio.Server. """
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        # Stop the running searches as well.
+        with self.lock:
+            for slot in range(len(self.flags)):
+                self.flags[slot] = 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+async def query(host, port, **request):
+    """ Minimal client: sends one request on a new connection and returns the response. """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+async def serve_forever(host, port, server):
+    tcp_server = await server.serve(host, port)
+    print(f"Serving on {host}:{port}.")
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves best moves found with MCTS over TCP (JSON lines).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    parser.add_argument("--simulations", type=int, default=1000, help="Default number of simulations per request.")
+    parser.add_argument("--deadline-ms", type=float, help="Default deadline per request.")
+    parser.add_argument("--children", type=int, default=20, help="n_children of the searches.")
+    parser.add_argument("--cache-size", type=int, default=64, help="Number of cached search trees per worker.")
+    parser.add_argument("--book", help="Opening book file (see chess.book).")
+    args = parser.parse_args(argv)
+
+    book = None
+    if args.book:
+        from .book import OpeningBook
+        book = OpeningBook(args.book)
+    server = MoveServer(args.workers, args.simulations, args.deadline_ms, args.children, args.cache_size, book)
+    try:
+        asyncio.run(serve_forever(args.host, args.port, server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Movement tables shared by the object model (chess.py), Position (position.py), BitboardPosition (bitboard.py) and evaluate.py.
+# Squares are indexed by square = y*8 + x, i.e., square 0 is A1, square 7 is H1 and square 63 is H8. Bit masks have the bit 1 << square per square.
+
+# Movement directions (dx, dy) of the sliding pieces.
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+# Movement offsets (dx, dy) of the stepping pieces.
+KNIGHT_OFFSETS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+KING_OFFSETS = QUEEN_DIRECTIONS
+
+def square(x, y):
+    return y * 8 + x
+
+def coordinates(sq):
+    """ Field coordinates (x, y) of a square. """
+    return sq & 7, sq >> 3
+
+def on_board(x, y):
+    return 0 <= x < 8 and 0 <= y < 8
+
+def precompute_rays(directions):
+    """ For every square, the rays in each direction as tuples of squares, ordered by distance. """
+    rays = []
+    for sq in range(64):
+        x, y = coordinates(sq)
+        square_rays = []
+        for dx, dy in directions:
+            ray = []
+            xt, yt = x + dx, y + dy
+            while on_board(xt, yt):
+                ray.append(square(xt, yt))
+                xt, yt = xt + dx, yt + dy
+            if ray:
+                square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return tuple(rays)
+
+def precompute_steps(offsets):
+    """ For every square, the squares reachable by one of the offsets. """
+    steps = []
+    for sq in range(64):
+        x, y = coordinates(sq)
+        steps.append(tuple(square(x + dx, y + dy) for dx, dy in offsets if on_board(x + dx, y + dy)))
+    return tuple(steps)
+
+ROOK_RAYS = precompute_rays(ROOK_DIRECTIONS)
+BISHOP_RAYS = precompute_rays(BISHOP_DIRECTIONS)
+QUEEN_RAYS = precompute_rays(QUEEN_DIRECTIONS)
+KNIGHT_STEPS = precompute_steps(KNIGHT_OFFSETS)
+KING_STEPS = precompute_steps(KING_OFFSETS)
+
+def precompute_lines():
+    """ Bit masks for pairs of squares on a common row, column or diagonal.
+        Returns (between, rook_lines, bishop_lines): between[start][target] has the squares strictly between start and target (None if they are not on a line),
+        rook_lines[start] and bishop_lines[start] have all squares reachable from start by rook or bishop movement on an empty board.
+    """
+    between = [[None] * 64 for start in range(64)]
+    rook_lines = [0] * 64
+    bishop_lines = [0] * 64
+    for start in range(64):
+        for rays, lines in ((ROOK_RAYS, rook_lines), (BISHOP_RAYS, bishop_lines)):
+            for ray in rays[start]:
+                mask = 0
+                for target in ray:
+                    between[start][target] = mask
+                    lines[start] |= 1 << target
+                    mask |= 1 << target
+    return between, rook_lines, bishop_lines
+
+BETWEEN, ROOK_LINES, BISHOP_LINES = precompute_lines()
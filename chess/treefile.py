@@ -0,0 +1,223 @@
+# Compact binary files of MCTS search trees.
+# A tree is stored as a flat array of fixed size node records (NODE_DTYPE, 32 bytes) in breadth-first order, so the child nodes of a node
+# are consecutive records. A record holds the index of the parent, the index of the first child and the number of children, the move
+# as start and target squares, the wins and simulations and the Zobrist hash of the game situation. No game states are stored.
+# The untried moves of nodes (see MCTS.add_children) are not stored either: with progressive widening, a loaded node keeps the child nodes
+# it had when it was saved and gets no further ones.
+# load maps the file into memory (numpy.memmap), so even trees of millions of nodes load instantly, and processes mapping
+# the same file share its pages read-only.
+import numpy as np
+
+from .position import square, coordinates
+
+MAGIC = b"MCTREE"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S6"),
+    ("version", "<u2"),
+    # Node level of the root node (determines the player of winner(i)).
+    ("root_level", "<u4"),
+    ("n_nodes", "<u4"),
+])
+
+NODE_DTYPE = np.dtype([
+    ("parent", "<i4"),
+    ("first_child", "<i4"),
+    ("n_children", "<u2"),
+    ("start", "u1"),
+    ("target", "u1"),
+    ("wins", "<f8"),
+    ("simulations", "<u4"),
+    ("hash", "<u8"),
+])
+
+# Parent index of the root node and square of the missing move of the root node.
+NO_PARENT = -1
+NO_SQUARE = 255
+
+def encode_move(move):
+    """ Start and target square of a move ((xs, ys), (xt, yt)) (NO_SQUARE for None). """
+    if move is None:
+        return NO_SQUARE, NO_SQUARE
+    (xs, ys), (xt, yt) = move
+    return square(xs, ys), square(xt, yt)
+
+def decode_move(start, target):
+    if start == NO_SQUARE:
+        return None
+    return coordinates(start), coordinates(target)
+
+def breadth_first(root):
+    """ The nodes below root in breadth-first order, and for every node the index of its first child.
+        Nodes sharing their child nodes (through a transposition table) get the same first child, the child nodes are listed once.
+    """
+    nodes = [root]
+    first_child = []
+    # Index of the first node of every child list listed so far, by id of the list.
+    listed = {}
+    i = 0
+    while i < len(nodes):
+        children = nodes[i].children
+        if not children:
+            first_child.append(NO_PARENT)
+        elif id(children) in listed:
+            first_child.append(listed[id(children)])
+        else:
+            listed[id(children)] = len(nodes)
+            first_child.append(len(nodes))
+            nodes.extend(children)
+        i += 1
+    return nodes, first_child
+
+def tree_hashes(root, nodes):
+    """ Zobrist hashes of the nodes. With a state holding a Position (GameControllerAdapter), the moves are replayed in place on a copy of it,
+        so no states are created. Otherwise, the key() of the state of every node is used.
+    """
+    position = getattr(root.state, "position", None)
+    if position is None:
+        return [node.state.key() for node in nodes]
+    hashes = {}
+    position = position.copy()
+    # Depth-first traversal: (node, whether its move has to be reverted).
+    stack = [(root, False)]
+    while stack:
+        node, revert = stack.pop()
+        if revert:
+            position.unmake_move()
+            continue
+        if node is not root:
+            position.make_move(*encode_move(node.move))
+            stack.append((node, True))
+        if id(node) not in hashes:
+            hashes[id(node)] = position.hash
+            stack.extend((c, False) for c in node.children)
+    return [hashes[id(node)] for node in nodes]
+
+def save(root, path):
+    """ Writes the tree below the node root to the file path. Moves must be pairs of start and target coordinates.
+        The untried moves of the nodes are not written.
+    """
+    nodes, first_child = breadth_first(root)
+    records = np.zeros(len(nodes), dtype=NODE_DTYPE)
+    records["first_child"] = first_child
+    records["n_children"] = [len(node.children) for node in nodes]
+    records["wins"] = [node.wins for node in nodes]
+    records["simulations"] = [node.simulations for node in nodes]
+    records["hash"] = tree_hashes(root, nodes)
+    moves = [encode_move(node.move) for node in nodes]
+    records["start"] = [start for start, target in moves]
+    records["target"] = [target for start, target in moves]
+    # Shared child nodes get the node listing them (the first one in breadth-first order) as parent.
+    parents = np.full(len(nodes), NO_PARENT, dtype=np.int32)
+    for i, (first, node) in enumerate(zip(first_child, nodes)):
+        if first != NO_PARENT and parents[first] == NO_PARENT:
+            parents[first:first + len(node.children)] = i
+    records["parent"] = parents
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["root_level"] = root.node_level
+    header["n_nodes"] = len(nodes)
+    with open(path, "wb") as f:
+        header.tofile(f)
+        records.tofile(f)
+
+def load(path, mmap=True):
+    """ Loads a tree written by save as a TreeFile. With mmap, the file is mapped read-only instead of read into memory. """
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} is not a search tree file.")
+    if header["version"][0] != VERSION:
+        raise ValueError(f"Unsupported search tree file version {header['version'][0]}.")
+    n_nodes = int(header["n_nodes"][0])
+    if mmap:
+        records = np.memmap(path, dtype=NODE_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(n_nodes,))
+    else:
+        records = np.fromfile(path, dtype=NODE_DTYPE, count=n_nodes, offset=HEADER_DTYPE.itemsize)
+    return TreeFile(records, int(header["root_level"][0]), path if mmap else None)
+
+class TreeFile:
+    """ The node records of a saved tree (the root is record 0) and the node level of the root.
+        The statistics can be read directly from the records, to_node creates Node objects to continue the search.
+        A memory-mapped TreeFile is pickled as its path, so worker processes map the file themselves.
+    """
+    def __init__(self, records, root_level, path=None):
+        self.records = records
+        self.root_level = root_level
+        self.path = path
+
+    def __getstate__(self):
+        if self.path is None:
+            return self.__dict__
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        if "records" in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(load(state["path"]).__dict__)
+
+    def __len__(self):
+        return len(self.records)
+
+    def children(self, i=0):
+        """ Record indices of the child nodes of record i. """
+        record = self.records[i]
+        first = int(record["first_child"])
+        return range(first, first + int(record["n_children"])) if first != NO_PARENT else range(0)
+
+    def move(self, i):
+        record = self.records[i]
+        return decode_move(int(record["start"]), int(record["target"]))
+
+    def node_level(self, i):
+        level = self.root_level
+        while i != 0:
+            i = int(self.records[i]["parent"])
+            level += 1
+        return level
+
+    def rank_child_nodes(self, i=0):
+        """ (move, wins, simulations) of the child nodes of record i, ranked by simulations like Node.rank_child_nodes. """
+        children = self.children(i)
+        records = self.records[children.start:children.stop]
+        order = np.argsort(-records["simulations"].astype(np.int64), kind="stable")
+        return [(self.move(children.start + j), float(records["wins"][j]), int(records["simulations"][j])) for j in order]
+
+    def to_node(self, state, i=0):
+        """ Creates the Node of record i with the tree below it, for the game state of record i. The states of the other nodes are created lazily.
+            Only the records below record i are read (one slice of the records per child list), so a memory-mapped file is read as far as needed.
+            The nodes have no untried moves (see save).
+            Raises ValueError if the key of state differs from the saved hash.
+        """
+        from .mcts import Node
+        records = self.records
+        record = records[i]
+        if state.key() != int(record["hash"]):
+            raise ValueError("The state does not match the saved search tree.")
+        root = Node(state, move=self.move(i))
+        root.node_level = self.node_level(i)
+        root.wins = float(record["wins"])
+        root.simulations = int(record["simulations"])
+        # Child lists created so far, by the index of their first record (shared child nodes share the list).
+        created = {}
+        nodes = [(root, int(record["first_child"]), int(record["n_children"]))]
+        while nodes:
+            node, first, n = nodes.pop()
+            if n == 0:
+                continue
+            if first in created:
+                node.children = created[first]
+                continue
+            children = records[first:first + n]
+            node.child_list().reserve(n)
+            for start, target, first_child, n_children in zip(children["start"].tolist(), children["target"].tolist(),
+                                                              children["first_child"].tolist(), children["n_children"].tolist()):
+                c = Node(None, move=decode_move(start, target))
+                node.add_child(c)
+                nodes.append((c, first_child, n_children))
+            node.children.wins[:n] = children["wins"]
+            node.children.simulations[:n] = children["simulations"]
+            created[first] = node.children
+        return root
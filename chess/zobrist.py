@@ -0,0 +1,26 @@
+# Zobrist hashing of game situations.
+# Every (piece code, square) pair and the black player being active get a random 64-bit key. The hash of a game situation is the xor
+# of the keys of its pieces (and BLACK_TO_MOVE if black is active), so a move updates the hash by xoring out and in a few keys.
+# The keys are drawn from a fixed seed, so hashes are the same in every process and run.
+import random
+
+_random = random.Random(0x5EED)
+
+# Keys indexed by [piece code][square]. Piece code 0 (empty square) has zero keys.
+PIECE_KEYS = ((0,) * 64,) + tuple(tuple(_random.getrandbits(64) for sq in range(64)) for code in range(1, 13))
+BLACK_TO_MOVE = _random.getrandbits(64)
+
+def hash_board(board, active):
+    """ Hash of a board of piece codes (indexed by square) with the given active player. """
+    h = BLACK_TO_MOVE if active else 0
+    for sq, code in enumerate(board):
+        if code:
+            h ^= PIECE_KEYS[code][sq]
+    return h
+
+def move_keys(code, start, target, beaten):
+    """ Xor of the keys changed by moving piece code from start to target, beating the piece code beaten (0 for none), including the player switch. """
+    keys = PIECE_KEYS[code][start] ^ PIECE_KEYS[code][target] ^ BLACK_TO_MOVE
+    if beaten:
+        keys ^= PIECE_KEYS[beaten][target]
+    return keys
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from chess.chess import GameController
+from chess.chess_adapter import GameControllerAdapter
+from chess.mcts import MCTS, TranspositionTable
+
+def reachable(node):
+    """ Number of nodes reachable from node through child and parent links. """
+    seen = {id(node)}
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for other in list(node.children) + ([] if node.parent is None else [node.parent]):
+            if id(other) not in seen:
+                seen.add(id(other))
+                stack.append(other)
+    return len(seen)
+
+def test_advance_frees_discarded_nodes_with_transposition_table():
+    random.seed(0)
+    mcts = MCTS(GameControllerAdapter(GameController()), transposition_table=TranspositionTable())
+    mcts.run(1000, verbose=False)
+    mcts.advance(mcts.node.best_child().move)
+    nodes = mcts.subtree()
+    assert reachable(mcts.node) == len(nodes)
+    for node in nodes:
+        for c in node.children:
+            assert c.parent.children is node.children
+            assert c.parent.children[c.index] is c
+
+@pytest.mark.parametrize("move", [((3, 3), (6, 6)), [[4, 1], [4, 3]]])
+def test_advance_rejects_impossible_moves(move):
+    mcts = MCTS(GameControllerAdapter(GameController()))
+    mcts.run(50, verbose=False)
+    with pytest.raises(ValueError):
+        mcts.advance(move)
+    assert mcts.node.state.position == GameController().get_position()
@@ -0,0 +1,27 @@
+import random
+
+from chess import book
+from chess.chess_adapter import GameControllerAdapter
+from chess.position import Position, BLACK, KING, QUEEN, PAWN, BLACK_OFFSET, square
+
+def black_wins_in_one():
+    """ Black to move, the black queen on e3 can beat the white king on e1. """
+    board = bytearray(64)
+    board[square(4, 0)] = KING
+    board[square(0, 1)] = PAWN
+    board[square(7, 1)] = PAWN
+    board[square(4, 7)] = KING + BLACK_OFFSET
+    board[square(4, 2)] = QUEEN + BLACK_OFFSET
+    return GameControllerAdapter(position=Position(board, BLACK))
+
+def test_book_moves_favour_black_to_move(tmp_path):
+    random.seed(0)
+    state = black_wins_in_one()
+    rankings = book.build(state, n_plies=1, n_simulations=300)
+    move, wins, simulations = rankings[state.key()][0]
+    assert move == ((4, 2), (4, 0))
+    assert wins == simulations
+
+    path = tmp_path / "book.bin"
+    book.save(rankings, path)
+    assert book.OpeningBook(path).best_move(state.key()) == ((4, 2), (4, 0))
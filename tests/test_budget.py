@@ -0,0 +1,18 @@
+import random
+
+import pytest
+
+from chess.chess import GameController
+from chess.chess_adapter import GameControllerAdapter
+from chess.mcts import MCTS, TranspositionTable
+
+@pytest.mark.parametrize("transposition_table", [False, True])
+@pytest.mark.parametrize("budget", [{"max_tree_nodes": 300}, {"max_tree_bytes": 100000}, {"max_tree_nodes": 25}])
+def test_tree_counters_match_recount(transposition_table, budget):
+    random.seed(0)
+    mcts = MCTS(GameControllerAdapter(GameController()), transposition_table=TranspositionTable() if transposition_table else None, **budget)
+    mcts.run(500, verbose=False, n_children=40)
+    assert mcts.n_evicted > 0
+    counted = (mcts.tree_nodes, mcts.tree_states)
+    mcts.count_tree()
+    assert counted == (mcts.tree_nodes, mcts.tree_states)
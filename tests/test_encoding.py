@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+from chess.chess import GameController
+from chess.encoding import BINARY_SIZE, encode, decode, encode_binary, decode_binary, write_positions, read_positions, read_boards
+from chess.position import Position, WHITE, BLACK
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w"
+
+def random_positions(n, seed=0):
+    """ Positions of random games, including finished ones. """
+    random.seed(seed)
+    positions = []
+    position = Position()
+    while len(positions) < n:
+        positions.append(position.copy())
+        moves = position.moves()
+        if position.winner is not None or not moves:
+            position = Position()
+            continue
+        position.make_move(*random.choice(moves))
+    return positions
+
+def test_start_position_text():
+    assert encode(Position()) == START
+    assert decode(START) == Position()
+
+def test_round_trips():
+    positions = random_positions(500)
+    assert any(position.winner is not None for position in positions)
+    for position in positions:
+        assert decode(encode(position)) == position
+        binary = encode(position, binary=True)
+        assert len(binary) == BINARY_SIZE
+        assert decode(binary) == position
+
+def test_controller_round_trip():
+    ctl = GameController()
+    ctl.move((4, 1), (4, 3), verbose=False)
+    encoding = ctl.to_encoding()
+    assert encoding == "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b"
+    assert GameController.from_encoding(encoding).get_position() == ctl.get_position()
+    assert GameController.from_encoding(ctl.to_encoding(binary=True)).get_position() == ctl.get_position()
+
+@pytest.mark.parametrize("binary", [True, False])
+@pytest.mark.parametrize("reuse", [False, True])
+def test_read_positions(tmp_path, binary, reuse):
+    positions = random_positions(300)
+    path = tmp_path / "positions"
+    write_positions(path, positions, binary)
+    read = [position.copy() for position in read_positions(path, binary, reuse, chunk_size=64)]
+    assert read == positions
+
+def test_read_boards(tmp_path):
+    positions = random_positions(300)
+    path = tmp_path / "positions.bin"
+    write_positions(path, positions)
+    boards, active, winners = read_boards(path)
+    assert boards.tobytes() == b"".join(position.board for position in positions)
+    assert active.tolist() == [position.active for position in positions]
+    assert winners.tolist() == [-1 if position.winner is None else position.winner for position in positions]
+
+def test_read_boards_empty_file(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    boards, active, winners = read_boards(path)
+    assert boards.shape == (0, 64)
+    assert active.shape == winners.shape == (0,)
+    assert list(read_positions(path)) == []
+
+@pytest.mark.parametrize("invalid", [
+    # Winner flag 3.
+    encode_binary(Position().board, WHITE, None)[:32] + bytes([3 << 1]),
+    # Piece code 13.
+    bytes([13]) + encode_binary(Position().board, BLACK, None)[1:],
+    # Missing the flag byte.
+    encode_binary(Position().board, WHITE, None)[:32],
+])
+def test_invalid_binary_encoding(tmp_path, invalid):
+    with pytest.raises(ValueError):
+        decode_binary(invalid)
+    path = tmp_path / "invalid.bin"
+    path.write_bytes(invalid)
+    with pytest.raises(ValueError):
+        read_boards(path)
+    with pytest.raises(ValueError):
+        list(read_positions(path))
+
+def test_invalid_text_encoding():
+    for text in ("", "8/8/8/8/8/8/8 w", "9/8/8/8/8/8/8/8 w", "8/8/8/8/8/8/8/8 x", "rnbqkbnX/8/8/8/8/8/8/8 w"):
+        with pytest.raises(ValueError):
+            decode(text)
@@ -0,0 +1,61 @@
+import random
+
+from chess.bench import legal_moves, legal_moves_naive
+from chess.chess import GameController
+from chess.position import Position, BLACK, KING, QUEEN, ROOK, PAWN, BISHOP, BLACK_OFFSET, square
+
+def position(pieces, active):
+    """ A Position with the pieces {(x, y): piece code}. """
+    board = bytearray(64)
+    for (x, y), code in pieces.items():
+        board[square(x, y)] = code
+    return Position(board, active)
+
+def test_legal_moves_match_naive_filter():
+    # The attack maps are updated incrementally while the games are played.
+    random.seed(0)
+    for game in range(3):
+        ctl = GameController(legal=True)
+        for ply in range(60):
+            pseudo_legal = GameController.from_position(ctl.get_position())
+            assert legal_moves(ctl) == legal_moves_naive(pseudo_legal)
+            moves = [(piece, field) for piece, fields in ctl.get_possible_moves() for field in fields]
+            if ctl.game.winner is not None or not moves:
+                break
+            piece, field = random.choice(moves)
+            ctl.move_piece(piece, field, verbose=False)
+
+def test_check_allows_only_evasions():
+    # The black rook on e8 checks the white king on e1. The white bishop on c3 is pinned by the black bishop on a5 (and cannot block).
+    ctl = GameController.from_position(position({
+        (4, 0): KING, (0, 1): ROOK, (2, 2): BISHOP,
+        (4, 7): ROOK + BLACK_OFFSET, (0, 4): BISHOP + BLACK_OFFSET, (7, 7): KING + BLACK_OFFSET,
+    }, 0), legal=True)
+    assert ctl.is_in_check()
+    assert legal_moves(ctl) == {
+        (4, 0): [(3, 0), (3, 1), (5, 0), (5, 1)],
+        (0, 1): [(4, 1)],
+        (2, 2): [],
+    }
+
+def test_back_rank_mate_wins():
+    ctl = GameController.from_position(position({
+        (6, 0): KING, (5, 1): PAWN, (6, 1): PAWN, (7, 1): PAWN,
+        (0, 6): ROOK + BLACK_OFFSET, (6, 7): KING + BLACK_OFFSET,
+    }, BLACK), legal=True)
+    assert ctl.game.winner is None
+    assert ctl.move((0, 6), (0, 0), verbose=False)
+    assert ctl.is_in_check()
+    assert not any(moves for piece, moves in ctl.get_possible_moves())
+    assert ctl.game.winner is ctl.game.players[BLACK]
+
+def test_stalemate_has_no_winner():
+    # Black king on h8, white queen on g6 (after the move) and white king on f7: black has no moves but is not in check.
+    ctl = GameController.from_position(position({
+        (5, 6): KING, (6, 4): QUEEN,
+        (7, 7): KING + BLACK_OFFSET,
+    }, 0), legal=True)
+    assert ctl.move((6, 4), (6, 5), verbose=False)
+    assert not ctl.is_in_check()
+    assert not any(moves for piece, moves in ctl.get_possible_moves())
+    assert ctl.game.winner is None
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from chess.bench import perft, perft_controller
+from chess.bitboard import BitboardPosition
+from chess.chess import GameController
+from chess.position import Position, WHITE, EMPTY, KNIGHT, BISHOP, ROOK, QUEEN, KING, COLOR, KIND, square
+
+def space_free(board, start, target):
+    """ Board.is_space_free of the original rules: no piece between start and target, and target is empty or held by an enemy piece. """
+    (xs, ys), (xt, yt) = start, target
+    own = COLOR[board[square(xs, ys)]]
+    dx, dy = (xt > xs) - (xt < xs), (yt > ys) - (yt < ys)
+    x, y = xs + dx, ys + dy
+    while (x, y) != (xt, yt):
+        if board[square(x, y)] != EMPTY:
+            return False
+        x, y = x + dx, y + dy
+    return COLOR[board[square(xt, yt)]] != own
+
+def can_move_to(board, start, target):
+    """ Piece.can_move_to as it was before the direction tables, on a board of piece codes (see position.py). """
+    (xs, ys), (xt, yt) = start, target
+    code = board[square(xs, ys)]
+    kind, color = KIND[code], COLOR[code]
+    target_color = COLOR[board[square(xt, yt)]]
+    dx, dy = abs(xt - xs), abs(yt - ys)
+    straight = (xt == xs) != (yt == ys)
+    diagonal = dx == dy and dx != 0
+    if kind == ROOK:
+        return straight and space_free(board, start, target)
+    if kind == BISHOP:
+        return diagonal and space_free(board, start, target)
+    if kind == QUEEN:
+        return (straight or diagonal) and space_free(board, start, target)
+    if kind == KING:
+        return target_color != color and max(dx, dy) == 1
+    if kind == KNIGHT:
+        return target_color != color and {dx, dy} == {1, 2}
+    forward = 1 if color == WHITE else -1
+    if dx == 1 and yt == ys + forward:
+        return target_color is not None and target_color != color
+    if xt == xs and yt == ys + forward:
+        return target_color is None
+    # As in the original rules, the target of the initial movement may hold an enemy piece.
+    return xt == xs and ys == (1 if color == WHITE else 6) and yt == ys + 2 * forward and space_free(board, start, target)
+
+def scanned_moves(ctl):
+    """ The moves of the active player found by checking can_move_to on every field in print order (last row first, each row from left
+        to right), for the pieces in the order of Player.pieces: the move generation before the direction tables.
+    """
+    board = ctl.get_position().board
+    moves = []
+    for piece in ctl.game.activePlayer.pieces:
+        start = piece.coordinates()
+        moves.append((start, [(x, y) for y in reversed(range(8)) for x in range(8) if (x, y) != start and can_move_to(board, start, (x, y))]))
+    return moves
+
+@pytest.mark.parametrize("backend", ["objects", "array", "bitboard"])
+def test_moves_match_can_move_to_scan(backend):
+    random.seed(0)
+    for game in range(10):
+        ctl = GameController(backend=backend)
+        for ply in range(150):
+            moves = ctl.get_possible_moves()
+            # Same pieces and targets in the same order.
+            assert [(piece.coordinates(), [field.coordinates() for field in fields]) for piece, fields in moves] == scanned_moves(ctl)
+            moves = [(piece, field) for piece, fields in moves for field in fields]
+            if ctl.game.winner is not None or not moves:
+                break
+            piece, field = random.choice(moves)
+            ctl.move_piece(piece, field, verbose=False)
+
+@pytest.mark.parametrize("depth, nodes", [(1, 20), (2, 400), (3, 8902)])
+def test_perft_start_position(depth, nodes):
+    assert perft(Position(), depth) == nodes
+    assert perft(BitboardPosition(), depth) == nodes
+
+@pytest.mark.parametrize("depth, nodes", [(1, 20), (2, 400), (3, 8902)])
+def test_perft_object_model(depth, nodes):
+    assert perft_controller(GameController(), depth) == nodes
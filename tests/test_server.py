@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+
+from chess.encoding import encode
+from chess.position import Position
+from chess.server import MoveServer, parse_position, query
+
+START = encode(Position())
+
+def test_parse_moves():
+    position, hashes, moves = parse_position({"moves": [[4, 1, 4, 3], [4, 6, 4, 4]]})
+    assert len(hashes) == 3 and hashes[-1] == position.hash
+    assert moves == [[4, 1, 4, 3], [4, 6, 4, 4]]
+
+def test_parse_encoding_has_no_moves():
+    position, hashes, moves = parse_position({"encoding": START})
+    assert position == Position()
+    assert hashes == [position.hash] and moves == []
+
+@pytest.mark.parametrize("request_", [
+    # d4 is empty.
+    {"moves": [[3, 3, 6, 6]]},
+    # Moves must not be combined with an encoding or a board.
+    {"encoding": START, "moves": [[3, 3, 6, 6]]},
+    {"encoding": START, "moves": [[4, 1, 4, 3]]},
+    {"board": bytes(Position().board).hex(), "moves": [[4, 1, 4, 3]]},
+])
+def test_parse_rejects_invalid_moves(request_):
+    with pytest.raises(ValueError):
+        parse_position(request_)
+
+async def serve(server):
+    tcp_server = await server.serve("127.0.0.1", 0)
+    return tcp_server, tcp_server.sockets[0].getsockname()[1]
+
+def test_concurrent_requests_get_moves():
+    # More requests than workers: the deadlines of the waiting requests run out before they are searched.
+    async def run():
+        server = MoveServer(n_workers=2, simulations=None)
+        tcp_server, port = await serve(server)
+        try:
+            return await asyncio.gather(*(query("127.0.0.1", port, id=i, deadline_ms=200) for i in range(5)))
+        finally:
+            tcp_server.close()
+            server.close()
+    for i, response in enumerate(asyncio.run(run())):
+        assert response["id"] == i
+        assert len(response["move"]) == 4 and response["stop_reason"] == "time"
+
+def test_cancel_stops_search():
+    async def run():
+        server = MoveServer(n_workers=1)
+        tcp_server, port = await serve(server)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            writer.write(b'{"id": 1, "simulations": 1000000}\n[1]\n')
+            await writer.drain()
+            assert json.loads(await reader.readline()) == {"error": "A request is a JSON object."}
+            await asyncio.sleep(0.2)
+            writer.write(b'{"cancel": 1}\n')
+            await writer.drain()
+            assert json.loads(await reader.readline()) == {"cancelled": True, "id": 1}
+            # The only worker is free again.
+            return await asyncio.wait_for(query("127.0.0.1", port, id=2, simulations=10), 5)
+        finally:
+            writer.close()
+            tcp_server.close()
+            server.close()
+    response = asyncio.run(run())
+    assert response["id"] == 2 and response["simulations"] == 10